@@ -0,0 +1,219 @@
+# backend/app/ai_jobs.py
+"""AI cleanup jobs: uploads spooled to disk, work done in a process pool.
+
+Results are written to their own content-addressed store (not the gallery's)
+and remembered by (kind, input digest), so re-submitting the same board
+returns the cached result without running the model again. Result files
+older than ``AI_RESULT_TTL`` are swept as jobs finish.
+"""
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional, Tuple
+
+import aiofiles
+from fastapi import HTTPException, UploadFile, status
+
+from .ai_service import PROCESSORS
+from .blobstore import BlobStore
+from .cache import TTLCache
+
+AI_UPLOAD_DIR = os.getenv("AI_UPLOAD_DIR", "./ai_uploads")
+AI_RESULT_DIR = os.getenv("AI_RESULT_DIR", "./ai_results")
+AI_WORKERS = int(os.getenv("AI_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Jobs queued or running at once; further submissions get 503
+AI_MAX_PENDING = int(os.getenv("AI_MAX_PENDING", "32"))
+AI_MAX_UPLOAD_BYTES = int(os.getenv("AI_MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+# How long finished jobs and cached results are remembered
+AI_RESULT_TTL = float(os.getenv("AI_RESULT_TTL", "3600"))
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Minimum gap between two sweeps of the result directory
+SWEEP_INTERVAL = min(AI_RESULT_TTL, 300)
+
+logger = logging.getLogger(__name__)
+
+def _pool_context():
+    # forking a process that runs an event loop and threadpools copies their locks
+    # mid-use; forkserver/spawn start workers from a clean interpreter
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+def _run_processor(kind: str, path: str, blob_root: str) -> Tuple[str, str]:
+    """Worker-process entry point: returns ``(mime, result digest)``."""
+    with open(path, "rb") as fh:
+        data = fh.read()
+    mime, result = PROCESSORS[kind](data)
+    store = BlobStore(blob_root)
+    digest = store.put(result)
+    # an identical earlier result may already be on disk; restart its expiry
+    os.utime(store.path(digest))
+    return mime, digest
+
+def _sweep_results(root: str, max_age: float) -> int:
+    """Delete result files not written for ``max_age`` seconds; returns how many."""
+    cutoff = time.time() - max_age
+    removed = 0
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.unlink(path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+    return removed
+
+class Job:
+    __slots__ = ("id", "kind", "digest", "status", "result_type", "result_digest", "error", "created", "future")
+
+    def __init__(self, kind: str, digest: str):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.digest = digest
+        self.status = "queued"
+        self.result_type: Optional[str] = None
+        self.result_digest: Optional[str] = None
+        self.error: Optional[str] = None
+        self.created = time.time()
+        self.future: Optional[asyncio.Future] = None
+
+    def to_dict(self) -> dict:
+        data = {"job_id": self.id, "kind": self.kind, "status": self.status}
+        if self.status == "done":
+            data["result_url"] = f"/api/ai/jobs/{self.id}/result"
+            data["result_type"] = self.result_type
+        if self.error:
+            data["error"] = self.error
+        return data
+
+class JobManager:
+    def __init__(self, store: Optional[BlobStore] = None, workers: int = AI_WORKERS, max_pending: int = AI_MAX_PENDING):
+        self.store = store or BlobStore(AI_RESULT_DIR)
+        self.workers = workers
+        self.max_pending = max_pending
+        self.jobs = TTLCache(maxsize=10000, ttl=AI_RESULT_TTL)
+        # (kind, input digest) -> finished Job, and the same for jobs still running
+        self.results = TTLCache(maxsize=10000, ttl=AI_RESULT_TTL)
+        self.in_flight: Dict[Tuple[str, str], Job] = {}
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._last_sweep = 0.0
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=_pool_context())
+        return self._executor
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def spool(self, upload: UploadFile) -> Tuple[str, str]:
+        """Stream an upload to a temp file, hashing as it goes; returns ``(path, sha256)``."""
+        os.makedirs(AI_UPLOAD_DIR, exist_ok=True)
+        fd, path = tempfile.mkstemp(dir=AI_UPLOAD_DIR, prefix="upload-")
+        os.close(fd)
+        sha = hashlib.sha256()
+        size = 0
+        try:
+            async with aiofiles.open(path, "wb") as out:
+                while True:
+                    chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > AI_MAX_UPLOAD_BYTES:
+                        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Upload too large")
+                    sha.update(chunk)
+                    await out.write(chunk)
+        except BaseException:
+            os.unlink(path)
+            raise
+        return path, sha.hexdigest()
+
+    async def submit(self, kind: str, upload: UploadFile) -> Job:
+        if kind not in PROCESSORS:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown job kind: {kind}")
+        path, digest = await self.spool(upload)
+        key = (kind, digest)
+        job = self.results.get(key) or self.in_flight.get(key)
+        if job is not None and (job.status != "done" or self.store.exists(job.result_digest)):
+            os.unlink(path)
+            self.jobs.set(job.id, job)
+            return job
+        if len(self.in_flight) >= self.max_pending:
+            os.unlink(path)
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="AI workers are busy, try again shortly")
+        job = Job(kind, digest)
+        self.jobs.set(job.id, job)
+        self.in_flight[key] = job
+        job.future = asyncio.ensure_future(self._run(job, path))
+        return job
+
+    async def _run(self, job: Job, path: str):
+        key = (job.kind, job.digest)
+        loop = asyncio.get_running_loop()
+        executor = self.executor
+        try:
+            job.status = "running"
+            job.result_type, job.result_digest = await loop.run_in_executor(
+                executor, _run_processor, job.kind, path, self.store.root
+            )
+            job.status = "done"
+            self.results.set(key, job)
+        except BrokenProcessPool:
+            # a worker died (e.g. killed for memory) and the pool refuses all work from
+            # now on; drop it so the next job starts a fresh one
+            logger.error("AI worker pool broke while running job %s", job.id)
+            if self._executor is executor:
+                self.shutdown()
+            job.status = "error"
+            job.error = "AI worker crashed, try again"
+        except Exception as exc:
+            job.status = "error"
+            job.error = str(exc) or exc.__class__.__name__
+        finally:
+            self.in_flight.pop(key, None)
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+        await self.sweep()
+
+    async def sweep(self, force: bool = False):
+        """Drop expired result files, at most once per ``SWEEP_INTERVAL`` unless forced."""
+        now = time.monotonic()
+        if not force and now - self._last_sweep < SWEEP_INTERVAL:
+            return
+        self._last_sweep = now
+        loop = asyncio.get_running_loop()
+        try:
+            removed = await loop.run_in_executor(None, _sweep_results, self.store.root, AI_RESULT_TTL)
+        except OSError:
+            logger.exception("sweeping %s failed", self.store.root)
+            return
+        if removed:
+            logger.info("swept %d expired AI results", removed)
+
+    def get(self, job_id: str) -> Job:
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+        return job
+
+    async def wait(self, job: Job, timeout: float) -> Job:
+        if job.future is not None and not job.future.done():
+            await asyncio.wait_for(asyncio.shield(job.future), timeout)
+        return job
+
+job_manager = JobManager()
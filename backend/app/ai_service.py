@@ -1,14 +1,152 @@
+# backend/app/ai_service.py
+"""Board cleanup routines.
 
-from fastapi import APIRouter, Form
+These are plain CPU-bound functions of bytes -> (mime, bytes) so they can run
+in a worker process (see ai_jobs). Swap in a real model behind the same
+signatures.
+
+Vector input is JSON: a list of board ops, or ``{"ops": [...]}``, where an op
+looks like ``{"kind": "stroke", "tool": "pen", "color": ..., "width": ...,
+"points": [x0, y0, x1, y1, ...]}`` (the format used on /ws/board).
+"""
+import io
 import json
+import math
+from typing import List, Optional, Tuple
+
+try:
+    from PIL import Image, ImageFilter, ImageOps
+except ImportError:  # pragma: no cover - optional dependency
+    Image = None
+
+# A stroke whose endpoints are this close (relative to its length) is closed
+CLOSED_RATIO = 0.15
+# Endpoint distance / path length above which a stroke is a straight line
+LINE_STRAIGHTNESS = 0.95
+# Mean fit error (relative to shape size) below which a shape is recognized
+SHAPE_TOLERANCE = 0.12
+# Douglas-Peucker tolerance, in canvas pixels
+SIMPLIFY_EPSILON = 1.0
+
+Points = List[Tuple[float, float]]
+
+def _pairs(flat: List[float]) -> Points:
+    return list(zip(flat[0::2], flat[1::2]))
+
+def _flatten(points: Points) -> List[float]:
+    return [round(c, 2) for p in points for c in p]
+
+def _path_length(points: Points) -> float:
+    return sum(math.dist(a, b) for a, b in zip(points, points[1:]))
+
+def chaikin(points: Points, iterations: int = 2) -> Points:
+    """Corner-cutting smoothing; keeps the endpoints fixed."""
+    for _ in range(iterations):
+        if len(points) < 3:
+            return points
+        out = [points[0]]
+        for (x0, y0), (x1, y1) in zip(points, points[1:]):
+            out.append((0.75 * x0 + 0.25 * x1, 0.75 * y0 + 0.25 * y1))
+            out.append((0.25 * x0 + 0.75 * x1, 0.25 * y0 + 0.75 * y1))
+        out.append(points[-1])
+        points = out
+    return points
+
+def simplify(points: Points, epsilon: float = SIMPLIFY_EPSILON) -> Points:
+    """Ramer-Douglas-Peucker, iterative to stay clear of the recursion limit."""
+    if len(points) < 3:
+        return points
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        (ax, ay), (bx, by) = points[start], points[end]
+        seg = math.hypot(bx - ax, by - ay)
+        best, index = 0.0, None
+        for i in range(start + 1, end):
+            px, py = points[i]
+            if seg == 0:
+                d = math.hypot(px - ax, py - ay)
+            else:
+                d = abs((bx - ax) * (ay - py) - (ax - px) * (by - ay)) / seg
+            if d > best:
+                best, index = d, i
+        if index is not None and best > epsilon:
+            keep[index] = True
+            stack.append((start, index))
+            stack.append((index, end))
+    return [p for p, k in zip(points, keep) if k]
+
+def _rect_error(points: Points, box) -> float:
+    x0, y0, x1, y1 = box
+    size = max(x1 - x0, y1 - y0)
+    err = sum(min(abs(x - x0), abs(x - x1), abs(y - y0), abs(y - y1)) for x, y in points)
+    return err / len(points) / size
+
+def _ellipse_error(points: Points, box) -> float:
+    x0, y0, x1, y1 = box
+    cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+    rx, ry = max((x1 - x0) / 2, 1e-6), max((y1 - y0) / 2, 1e-6)
+    err = sum(abs(math.hypot((x - cx) / rx, (y - cy) / ry) - 1) for x, y in points)
+    return err / len(points)
+
+def recognize_shape(points: Points) -> Optional[Tuple[str, List[float]]]:
+    """Return ``(tool, corner points)`` if a freehand stroke looks like a line, rect or ellipse."""
+    if len(points) < 4:
+        return None
+    length = _path_length(points)
+    if length == 0:
+        return None
+    first, last = points[0], points[-1]
+    if math.dist(first, last) / length >= LINE_STRAIGHTNESS:
+        return "line", _flatten([first, last])
+    if math.dist(first, last) / length > CLOSED_RATIO:
+        return None
+    xs, ys = [p[0] for p in points], [p[1] for p in points]
+    box = (min(xs), min(ys), max(xs), max(ys))
+    if box[2] - box[0] < 4 or box[3] - box[1] < 4:
+        return None
+    rect_err, ellipse_err = _rect_error(points, box), _ellipse_error(points, box)
+    tool, err = ("rect", rect_err) if rect_err < ellipse_err else ("ellipse", ellipse_err)
+    if err > SHAPE_TOLERANCE:
+        return None
+    return tool, _flatten([(box[0], box[1]), (box[2], box[3])])
+
+def cleanup_op(op: dict) -> dict:
+    if op.get("kind") != "stroke" or op.get("tool", "pen") != "pen":
+        return op
+    points = _pairs(op.get("points") or [])
+    shape = recognize_shape(points)
+    if shape is not None:
+        tool, corners = shape
+        return {**op, "kind": "shape", "tool": tool, "points": corners}
+    return {**op, "points": _flatten(simplify(chaikin(points)))}
+
+def cleanup_vector(data: bytes) -> Tuple[str, bytes]:
+    """Smooth freehand strokes and snap near-shapes to clean primitives."""
+    parsed = json.loads(data)
+    ops = parsed.get("ops", []) if isinstance(parsed, dict) else parsed
+    if not isinstance(ops, list):
+        raise ValueError("expected a list of ops")
+    cleaned = [cleanup_op(op) if isinstance(op, dict) else op for op in ops]
+    return "application/json", json.dumps({"ops": cleaned}, separators=(",", ":")).encode()
 
-router = APIRouter(prefix="/api/ai", tags=["ai"])
+def cleanup_raster(data: bytes) -> Tuple[str, bytes]:
+    """Flatten onto white, drop speckle and stretch contrast; returns a PNG."""
+    if Image is None:
+        return "image/png", data
+    with Image.open(io.BytesIO(data)) as img:
+        img = img.convert("RGBA")
+        background = Image.new("RGBA", img.size, (255, 255, 255, 255))
+        flat = Image.alpha_composite(background, img).convert("RGB")
+        flat = flat.filter(ImageFilter.MedianFilter(3))
+        flat = ImageOps.autocontrast(flat, cutoff=1)
+        out = io.BytesIO()
+        flat.save(out, format="PNG", optimize=True)
+        return "image/png", out.getvalue()
 
-@router.post("/cleanup", summary="AI cleanup (stub)")
-async def ai_cleanup(data_json: str = Form(...)):
-    try:
-        parsed = json.loads(data_json)
-    except Exception:
-        parsed = {"error": "invalid json"}
-    # Stub - return same data. Replace with real model call.
-    return {"ok": True, "cleaned": parsed}
+PROCESSORS = {
+    "vector": cleanup_vector,
+    "raster": cleanup_raster,
+}
@@ -1,4 +1,9 @@
 # backend/app/auth.py
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import Optional
 
@@ -9,18 +14,34 @@ from passlib.context import CryptContext
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from .db import AsyncSessionLocal
-from . import models
+from .cache import TTLCache
+from .db import get_db
+from . import models, schemas
 
 # Security config (replace SECRET_KEY with env var in production)
 SECRET_KEY = "supersecretkey"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
+# bcrypt is deliberately slow; it runs on its own small pool so logins never
+# block the event loop, and at most BCRYPT_MAX_CONCURRENCY hashes are in flight
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", "2"))
+BCRYPT_MAX_CONCURRENCY = int(os.getenv("BCRYPT_MAX_CONCURRENCY", "8"))
+# How long a looked-up user / verified token is reused without going back to the DB / crypto
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", "300"))
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/login")
 
-router = APIRouter()  # if you also add register/login endpoints here
+_hash_executor = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix="bcrypt")
+_hash_slots = asyncio.Semaphore(BCRYPT_MAX_CONCURRENCY)
+
+# token -> decoded payload, and username -> Principal
+_token_cache = TTLCache(maxsize=4096, ttl=TOKEN_CACHE_TTL)
+_user_cache = TTLCache(maxsize=1024, ttl=USER_CACHE_TTL)
+
+router = APIRouter()
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
@@ -28,6 +49,17 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
+async def _run_bcrypt(func, *args):
+    async with _hash_slots:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_hash_executor, func, *args)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await _run_bcrypt(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    return await _run_bcrypt(get_password_hash, password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
@@ -35,24 +67,87 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     # sub should hold username
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+def decode_token(token: str) -> dict:
+    """Verify a JWT, reusing the result for repeat presentations of the same token."""
+    payload = _token_cache.get(token)
+    if payload is not None:
+        return payload
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    # never trust a cached payload past the token's own expiry
+    exp = payload.get("exp")
+    ttl = exp - time.time() if exp else None
+    _token_cache.set(token, payload, ttl)
+    return payload
+
+@dataclass(frozen=True)
+class Principal:
+    """Detached snapshot of a user row.
+
+    This is what the cache holds and what ``get_current_user`` returns. An ORM
+    ``User`` would stay bound to the session that loaded it, and a rollback
+    there would expire it for every later request.
+    """
+    id: int
+    username: str
+    hashed_password: str
+
+def invalidate_user(username: str):
+    """Drop a cached user; call whenever a user row changes."""
+    _user_cache.pop(username)
+
+async def get_user(db: AsyncSession, username: str) -> Optional[Principal]:
+    user = _user_cache.get(username)
+    if user is not None:
+        return user
+    q = await db.execute(
+        select(models.User.id, models.User.username, models.User.hashed_password)
+        .where(models.User.username == username)
+    )
+    row = q.first()
+    if row is None:
+        return None
+    user = Principal(*row)
+    _user_cache.set(username, user)
+    return user
+
 # async dependency to get current user from token
-async def get_current_user(token: str = Depends(oauth2_scheme)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_token(token)
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
 
-    async with AsyncSessionLocal() as session:  # type: AsyncSession
-        q = await session.execute(select(models.User).where(models.User.username == username))
-        user = q.scalars().first()
-        if user is None:
-            raise HTTPException(status_code=404, detail="User not found")
-        return user
+    user = await get_user(db, username)
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user
+
+@router.post("/api/register", response_model=schemas.Token)
+async def register(payload: schemas.UserCreate, db: AsyncSession = Depends(get_db)):
+    q = await db.execute(select(models.User).where(models.User.username == payload.username))
+    if q.scalars().first() is not None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Username already registered")
+    hashed = await get_password_hash_async(payload.password)
+    db.add(models.User(username=payload.username, hashed_password=hashed))
+    await db.commit()
+    invalidate_user(payload.username)
+    return {"access_token": create_access_token({"sub": payload.username}), "token_type": "bearer"}
+
+@router.post("/api/login", response_model=schemas.Token)
+async def login(payload: schemas.UserCreate, db: AsyncSession = Depends(get_db)):
+    user = await get_user(db, payload.username)
+    if user is None or not await verify_password_async(payload.password, user.hashed_password):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Incorrect username or password",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return {"access_token": create_access_token({"sub": payload.username}), "token_type": "bearer"}
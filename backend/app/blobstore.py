@@ -0,0 +1,79 @@
+# backend/app/blobstore.py
+"""Content-addressed on-disk storage for image payloads.
+
+Blobs are stored once per SHA-256 digest under ``<root>/<ab>/<cd>/<digest>``,
+so saving the same board twice costs no extra disk. Writes go to a temp file
+and are renamed into place, which keeps concurrent saves of the same content
+safe.
+"""
+import base64
+import binascii
+import hashlib
+import os
+import re
+import tempfile
+from typing import Optional, Tuple
+
+BLOB_DIR = os.getenv("BLOB_DIR", "./blobs")
+
+_DATA_URL_RE = re.compile(r"^data:(?P<mime>[\w.+-]+/[\w.+-]+)?(?:;[\w-]+=[\w.-]+)*;base64,", re.ASCII)
+_DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+
+def decode_data_url(data: str) -> Tuple[str, bytes]:
+    """Split a ``data:<mime>;base64,...`` URL into its MIME type and raw bytes."""
+    match = _DATA_URL_RE.match(data)
+    if match is None:
+        raise ValueError("expected a base64 data URL")
+    try:
+        payload = base64.b64decode(data[match.end():], validate=True)
+    except binascii.Error:
+        raise ValueError("invalid base64 payload")
+    return match.group("mime") or "application/octet-stream", payload
+
+class BlobStore:
+    def __init__(self, root: str = BLOB_DIR):
+        self.root = root
+
+    def path(self, digest: str) -> str:
+        if not _DIGEST_RE.match(digest):
+            raise ValueError("invalid digest")
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def put(self, data: bytes) -> str:
+        """Store ``data`` if it is not already present and return its digest."""
+        digest = hashlib.sha256(data).hexdigest()
+        target = self.path(digest)
+        if os.path.exists(target):
+            return digest
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(data)
+            os.replace(tmp, target)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        return digest
+
+    def get(self, digest: str) -> bytes:
+        with open(self.path(digest), "rb") as fh:
+            return fh.read()
+
+    def exists(self, digest: str) -> bool:
+        return os.path.exists(self.path(digest))
+
+    def size(self, digest: str) -> Optional[int]:
+        try:
+            return os.path.getsize(self.path(digest))
+        except OSError:
+            return None
+
+    def delete(self, digest: str):
+        try:
+            os.unlink(self.path(digest))
+        except FileNotFoundError:
+            pass
+
+blob_store = BlobStore()
@@ -0,0 +1,161 @@
+# backend/app/board_store.py
+"""Board persistence: an append-only op log with periodic compacted snapshots.
+
+A save only inserts the new ops (one small row each) and bumps the board's
+version; every BOARD_SNAPSHOT_OPS ops, or whenever a clear comes in, the
+in-memory document is packed into ``Board.snapshot`` and the log rows it
+covers are deleted. Restoring a board is the latest snapshot plus the tail
+of the log after ``snapshot_seq``.
+"""
+import asyncio
+import json
+import os
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from . import models
+from .cache import TTLCache
+from .vector import BoardDocument
+
+# Log length (ops since the last snapshot) that triggers compaction
+BOARD_SNAPSHOT_OPS = int(os.getenv("BOARD_SNAPSHOT_OPS", "500"))
+# Parsed documents kept in memory per worker
+BOARD_CACHE_SIZE = int(os.getenv("BOARD_CACHE_SIZE", "64"))
+
+WRITE_RETRIES = 3
+# Boards hash onto this many locks; unrelated boards rarely share one
+LOCK_STRIPES = 64
+
+class BoardStore:
+    def __init__(self, snapshot_ops: int = BOARD_SNAPSHOT_OPS, cache_size: int = BOARD_CACHE_SIZE):
+        self.snapshot_ops = snapshot_ops
+        # board id -> (version, document)
+        self.documents = TTLCache(maxsize=cache_size, ttl=600)
+        # serializes writers to the same board within this worker
+        self._locks = [asyncio.Lock() for _ in range(LOCK_STRIPES)]
+
+    def _lock(self, board_id: int) -> asyncio.Lock:
+        return self._locks[board_id % len(self._locks)]
+
+    async def get_owned(self, db: AsyncSession, board_id: int, owner: str):
+        result = await db.execute(
+            select(models.Board).where(models.Board.id == board_id, models.Board.owner == owner)
+        )
+        board = result.scalars().first()
+        if not board:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Board not found")
+        return board
+
+    async def _tail(self, db: AsyncSession, board_id: int, since: int, upto: Optional[int] = None) -> List[Tuple[int, str]]:
+        query = (
+            select(models.BoardOperation.seq, models.BoardOperation.data)
+            .where(models.BoardOperation.board_id == board_id, models.BoardOperation.seq > since)
+            .order_by(models.BoardOperation.seq)
+        )
+        if upto is not None:
+            query = query.where(models.BoardOperation.seq <= upto)
+        return (await db.execute(query)).all()
+
+    async def load(self, db: AsyncSession, board) -> BoardDocument:
+        """Document at ``board.version``: cached copy, caught up from the log if it is behind.
+
+        Cached documents are shared with readers (tile renders run in threads);
+        catching up appends through a fork, which leaves their view unchanged.
+        """
+        cached = self.documents.get(board.id)
+        if cached is not None and cached[0] == board.version:
+            return cached[1]
+        async with self._lock(board.id):
+            return await self._load(db, board)
+
+    async def _load(self, db: AsyncSession, board) -> BoardDocument:
+        """``load`` for callers holding the board's lock (only one fork appends at a time)."""
+        snapshot_seq = board.snapshot_seq or 0
+        cached = self.documents.get(board.id)
+        if cached is not None and cached[0] == board.version:
+            return cached[1]
+        if cached is not None and snapshot_seq <= cached[0] < board.version:
+            start, doc = cached[0], cached[1].fork()
+        else:
+            result = await db.execute(select(models.Board.snapshot).where(models.Board.id == board.id))
+            start, doc = snapshot_seq, await run_in_threadpool(BoardDocument.from_bytes, result.scalar())
+        for _, data in await self._tail(db, board.id, start, board.version):
+            doc.add(json.loads(data))
+        cached = self.documents.get(board.id)
+        if cached is None or cached[0] < board.version:
+            self.documents.set(board.id, (board.version, doc))
+        return doc
+
+    async def ops_since(self, db: AsyncSession, board, since: int) -> Optional[List[dict]]:
+        """Logged ops after ``since``, or None once they have been compacted into the snapshot."""
+        if since < (board.snapshot_seq or 0):
+            return None
+        return [{"seq": seq, "op": json.loads(data)} for seq, data in await self._tail(db, board.id, since)]
+
+    async def append(self, db: AsyncSession, board_id: int, owner: str, ops: List[dict]) -> Tuple[int, List[Optional[int]]]:
+        """Log ``ops`` after the current head; returns ``(new version, element ids)``."""
+        async with self._lock(board_id):
+            for _ in range(WRITE_RETRIES):
+                board = await self.get_owned(db, board_id, owner)
+                base, snapshot_seq = board.version, board.snapshot_seq or 0
+                # the cached document may be in use by readers; build the new head on a fork
+                doc = (await self._load(db, board)).fork()
+                try:
+                    ids = [doc.add(op) for op in ops]
+                except ValueError as exc:
+                    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+                version = base + len(ops)
+                try:
+                    # optimistic lock: another worker may have appended since we read
+                    result = await db.execute(
+                        update(models.Board)
+                        .where(models.Board.id == board_id, models.Board.version == base)
+                        .values(version=version, element_count=len(doc))
+                    )
+                    if result.rowcount != 1:
+                        await db.rollback()
+                        db.expire_all()
+                        continue
+                    if version - snapshot_seq >= self.snapshot_ops or any(op.get("kind") == "clear" for op in ops):
+                        # these ops go straight into the snapshot, no need to log them first
+                        await self._compact(db, board_id, version, doc)
+                    else:
+                        db.add_all(
+                            models.BoardOperation(board_id=board_id, seq=base + i + 1, data=json.dumps(op, separators=(",", ":")))
+                            for i, op in enumerate(ops)
+                        )
+                    await db.commit()
+                except BaseException:
+                    # the commit may or may not have landed; reload from the database next time
+                    self.documents.pop(board_id)
+                    await db.rollback()
+                    raise
+                # publish the new head only once it is durable
+                self.documents.set(board_id, (version, doc))
+                return version, ids
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Board is being edited concurrently, retry")
+
+    async def _compact(self, db: AsyncSession, board_id: int, version: int, doc: BoardDocument):
+        """Fold the log up to ``version`` into the snapshot (within the caller's transaction)."""
+        snapshot = await run_in_threadpool(doc.to_bytes)
+        await db.execute(
+            update(models.Board)
+            .where(models.Board.id == board_id)
+            .values(snapshot=snapshot, snapshot_seq=version)
+        )
+        await db.execute(
+            delete(models.BoardOperation)
+            .where(models.BoardOperation.board_id == board_id, models.BoardOperation.seq <= version)
+        )
+
+    async def delete(self, db: AsyncSession, board_id: int):
+        await db.execute(delete(models.BoardOperation).where(models.BoardOperation.board_id == board_id))
+        await db.execute(delete(models.Board).where(models.Board.id == board_id))
+        await db.commit()
+        self.documents.pop(board_id)
+
+board_store = BoardStore()
@@ -0,0 +1,486 @@
+# backend/app/broker.py
+"""Pub/sub backends for realtime board fan-out.
+
+Every worker process owns the websockets connected to it; the broker carries
+room messages between workers and owns each room's sequenced op log so any
+worker can serve a late joiner. ``InMemoryBroker`` is enough for a single
+process; ``RedisBroker`` speaks the Redis protocol over a plain socket, so a
+local stand-in server works in tests.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from collections import deque
+from itertools import islice
+from typing import Callable, Deque, Dict, List, Optional, Set, Tuple
+from urllib.parse import urlparse
+
+# How many drawing ops each room keeps for late joiners
+MAX_OPS_PER_ROOM = 5000
+# ...and how many points (x, y pairs) those ops may hold in total, whichever limit is hit first
+MAX_POINTS_PER_ROOM = int(os.getenv("ROOM_LOG_MAX_POINTS", "500000"))
+# Room logs nobody has touched for this long (and with no local clients) are dropped
+ROOM_IDLE_TTL = float(os.getenv("ROOM_IDLE_TTL", "3600"))
+
+# Delay before reconnecting to Redis, doubling up to the max while it stays down
+RECONNECT_DELAY = 0.5
+MAX_RECONNECT_DELAY = 10.0
+
+logger = logging.getLogger(__name__)
+
+# (room, coalesce key or None, serialized message)
+Deliver = Callable[[str, Optional[str], str], None]
+
+def _op_points(op: dict) -> int:
+    return len(op.get("points") or ()) // 2
+
+class RoomLog:
+    """Sequenced log of drawing ops for one room, bounded by op count and total points.
+
+    ``epoch`` identifies this incarnation of the log; seqs restart from 1 when
+    a room's log is recreated (process restart, idle expiry), and clients use
+    the epoch to tell that their last seen seq no longer applies.
+    """
+
+    def __init__(self, maxlen: int = MAX_OPS_PER_ROOM, max_points: int = MAX_POINTS_PER_ROOM):
+        self.seq = 0
+        self.epoch = uuid.uuid4().hex[:12]
+        self.maxlen = maxlen
+        self.max_points = max_points
+        self.ops: Deque[dict] = deque()
+        self.points = 0
+        self.touched = time.monotonic()
+
+    def append(self, op: dict, client: str = "") -> dict:
+        self.seq += 1
+        entry = {"type": "op", "seq": self.seq, "client": client, "op": op}
+        self.ops.append(entry)
+        self.points += _op_points(op)
+        while len(self.ops) > 1 and (len(self.ops) > self.maxlen or self.points > self.max_points):
+            self.points -= _op_points(self.ops.popleft()["op"])
+        self.touched = time.monotonic()
+        return entry
+
+    def since(self, seq: int) -> List[dict]:
+        self.touched = time.monotonic()
+        if not self.ops:
+            return []
+        # seqs in the log are contiguous, so the offset is direct
+        start = max(0, seq - self.ops[0]["seq"] + 1)
+        return list(islice(self.ops, start, None))
+
+    def clear(self):
+        self.ops.clear()
+        self.points = 0
+
+class Broker:
+    """Interface every backend implements."""
+
+    async def start(self, deliver: Deliver):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+    async def subscribe(self, room: str):
+        raise NotImplementedError
+
+    async def unsubscribe(self, room: str):
+        raise NotImplementedError
+
+    async def publish(self, room: str, text: str, key: Optional[str] = None):
+        raise NotImplementedError
+
+    async def publish_op(self, room: str, op: dict, client: str = "") -> dict:
+        """Sequence ``op``, append it to the room log and publish it, as one atomic step.
+
+        Doing all three together keeps publish order equal to seq order
+        across workers, which clients rely on to detect gaps.
+        """
+        raise NotImplementedError
+
+    async def ops_since(self, room: str, seq: int) -> List[dict]:
+        raise NotImplementedError
+
+    async def current_seq(self, room: str) -> int:
+        raise NotImplementedError
+
+    async def epoch(self, room: str) -> str:
+        """Id of the room's current log; changes whenever seqs restart."""
+        raise NotImplementedError
+
+    async def set_affinity(self, room: str, worker: str, connections: int):
+        raise NotImplementedError
+
+    async def affinity(self) -> Dict[str, Dict[str, int]]:
+        raise NotImplementedError
+
+class InMemoryBroker(Broker):
+    """Single-process broker: publish is a direct call into the local fan-out."""
+
+    def __init__(self, idle_ttl: float = ROOM_IDLE_TTL):
+        self.rooms: Dict[str, RoomLog] = {}
+        self.subscribed = set()
+        self.workers: Dict[str, Dict[str, int]] = {}
+        self.idle_ttl = idle_ttl
+        self._deliver: Optional[Deliver] = None
+
+    async def start(self, deliver: Deliver):
+        self._deliver = deliver
+
+    async def subscribe(self, room: str):
+        self.subscribed.add(room)
+
+    async def unsubscribe(self, room: str):
+        self.subscribed.discard(room)
+
+    async def publish(self, room: str, text: str, key: Optional[str] = None):
+        if self._deliver is not None and room in self.subscribed:
+            self._deliver(room, key, text)
+
+    def room_log(self, room: str) -> RoomLog:
+        log = self.rooms.get(room)
+        if log is None:
+            self.expire_idle()
+            log = self.rooms[room] = RoomLog()
+        return log
+
+    def expire_idle(self):
+        """Drop logs of rooms with no subscribers that have been idle past ``idle_ttl``."""
+        cutoff = time.monotonic() - self.idle_ttl
+        for room in [r for r, log in self.rooms.items() if log.touched < cutoff and r not in self.subscribed]:
+            del self.rooms[room]
+
+    async def publish_op(self, room: str, op: dict, client: str = "") -> dict:
+        log = self.room_log(room)
+        if op.get("kind") == "clear":
+            # nothing before a clear matters to late joiners
+            log.clear()
+        entry = log.append(op, client)
+        # no await between append and delivery, so fan-out follows seq order
+        if self._deliver is not None and room in self.subscribed:
+            self._deliver(room, None, json.dumps(entry, separators=(",", ":")))
+        return entry
+
+    async def ops_since(self, room: str, seq: int) -> List[dict]:
+        if room not in self.rooms:
+            return []
+        return self.rooms[room].since(seq)
+
+    async def current_seq(self, room: str) -> int:
+        return self.rooms[room].seq if room in self.rooms else 0
+
+    async def epoch(self, room: str) -> str:
+        return self.room_log(room).epoch
+
+    async def set_affinity(self, room: str, worker: str, connections: int):
+        workers = self.workers.setdefault(room, {})
+        if connections:
+            workers[worker] = connections
+        else:
+            workers.pop(worker, None)
+            if not workers:
+                del self.workers[room]
+
+    async def affinity(self) -> Dict[str, Dict[str, int]]:
+        return {room: dict(workers) for room, workers in self.workers.items()}
+
+class RedisError(Exception):
+    pass
+
+class _RespConnection:
+    """Bare-bones RESP2 connection (commands in, replies out)."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def open(cls, host: str, port: int, db: int = 0, password: Optional[str] = None) -> "_RespConnection":
+        reader, writer = await asyncio.open_connection(host, port)
+        conn = cls(reader, writer)
+        if password:
+            await conn.call("AUTH", password)
+        if db:
+            await conn.call("SELECT", db)
+        return conn
+
+    def send(self, *args):
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self.writer.write(b"".join(parts))
+
+    async def read(self):
+        line = await self.reader.readline()
+        if not line:
+            raise ConnectionError("redis connection closed")
+        prefix, body = line[:1], line[1:-2]
+        if prefix == b"+":
+            return body.decode()
+        if prefix == b"-":
+            raise RedisError(body.decode())
+        if prefix == b":":
+            return int(body)
+        if prefix == b"$":
+            size = int(body)
+            if size < 0:
+                return None
+            data = await self.reader.readexactly(size + 2)
+            return data[:-2]
+        if prefix == b"*":
+            size = int(body)
+            if size < 0:
+                return None
+            return [await self.read() for _ in range(size)]
+        raise RedisError(f"unexpected reply {line!r}")
+
+    async def call(self, *args):
+        self.send(*args)
+        await self.writer.drain()
+        return await self.read()
+
+    async def close(self):
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except Exception:
+            pass
+
+# KEYS: seq counter, op log, epoch, point counts (per seq, plus "total")
+# ARGV: channel, client (JSON string), op (JSON), is clear, max ops, ttl, fresh epoch, op points, max points
+_PUBLISH_OP = """
+local seq = redis.call('INCR', KEYS[1])
+redis.call('SET', KEYS[3], ARGV[7], 'NX')
+local entry = '{"type":"op","seq":' .. seq .. ',"client":' .. ARGV[2] .. ',"op":' .. ARGV[3] .. '}'
+if ARGV[4] == '1' then redis.call('DEL', KEYS[2], KEYS[4]) end
+redis.call('ZADD', KEYS[2], seq, entry)
+redis.call('HSET', KEYS[4], seq, ARGV[8])
+local total = redis.call('HINCRBY', KEYS[4], 'total', ARGV[8])
+local count = redis.call('ZCARD', KEYS[2])
+while count > 1 and (count > tonumber(ARGV[5]) or total > tonumber(ARGV[9])) do
+  local head = redis.call('ZRANGE', KEYS[2], 0, 0, 'WITHSCORES')[2]
+  redis.call('ZREMRANGEBYRANK', KEYS[2], 0, 0)
+  total = redis.call('HINCRBY', KEYS[4], 'total', -tonumber(redis.call('HGET', KEYS[4], head) or '0'))
+  redis.call('HDEL', KEYS[4], head)
+  count = count - 1
+end
+redis.call('PUBLISH', ARGV[1], '\\n' .. entry)
+for i = 1, #KEYS do redis.call('EXPIRE', KEYS[i], ARGV[6]) end
+return entry
+"""
+
+# KEYS: room keys to keep alive; ARGV: ttl
+_TOUCH = """
+for i = 1, #KEYS do redis.call('EXPIRE', KEYS[i], ARGV[1]) end
+return #KEYS
+"""
+
+class RedisBroker(Broker):
+    """Redis-protocol broker for multiple workers and nodes.
+
+    Room messages go over ``PUBLISH``; op logs live in a sorted set scored by
+    sequence number. Ops are sequenced, logged and published by one Lua
+    script, so every subscriber sees them in seq order no matter which
+    worker appended them. Logs are trimmed by op count and total points like
+    ``RoomLog``. Room keys expire after ``idle_ttl`` without ops, but never
+    while this worker still has the room subscribed. Both connections
+    reconnect on failure; the pub/sub one resubscribes to every room this
+    worker still serves.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 6379, db: int = 0,
+                 password: Optional[str] = None, prefix: str = "board",
+                 max_ops: int = MAX_OPS_PER_ROOM, max_points: int = MAX_POINTS_PER_ROOM,
+                 idle_ttl: float = ROOM_IDLE_TTL):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.prefix = prefix
+        self.max_ops = max_ops
+        self.max_points = max_points
+        self.idle_ttl = idle_ttl
+        self.rooms: Set[str] = set()
+        self._cmd: Optional[_RespConnection] = None
+        self._sub: Optional[_RespConnection] = None
+        self._script_sha = hashlib.sha1(_PUBLISH_OP.encode()).hexdigest()
+        self._lock = asyncio.Lock()
+        self._sub_lock = asyncio.Lock()
+        self._listener: Optional[asyncio.Task] = None
+        self._keepalive: Optional[asyncio.Task] = None
+        self._deliver: Optional[Deliver] = None
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisBroker":
+        parsed = urlparse(url)
+        db = int(parsed.path.lstrip("/") or 0)
+        return cls(parsed.hostname or "127.0.0.1", parsed.port or 6379, db, parsed.password)
+
+    def _channel(self, room: str) -> str:
+        return f"{self.prefix}:room:{room}"
+
+    def _keys(self, room: str) -> Tuple[str, str, str, str]:
+        return tuple(f"{self.prefix}:{kind}:{room}" for kind in ("seq", "ops", "epoch", "pts"))
+
+    async def _open(self) -> _RespConnection:
+        return await _RespConnection.open(self.host, self.port, self.db, self.password)
+
+    async def start(self, deliver: Deliver):
+        self._deliver = deliver
+        self._cmd = await self._open()
+        self._sub = await self._open()
+        self._listener = asyncio.create_task(self._listen())
+        self._keepalive = asyncio.create_task(self._keep_rooms_alive())
+
+    async def close(self):
+        for task in (self._listener, self._keepalive):
+            if task is not None:
+                task.cancel()
+        self._listener = self._keepalive = None
+        for conn in (self._cmd, self._sub):
+            if conn is not None:
+                await conn.close()
+
+    async def _call(self, *args):
+        async with self._lock:
+            try:
+                return await self._cmd.call(*args)
+            except (ConnectionError, OSError, asyncio.IncompleteReadError) as exc:
+                # one retry on a fresh connection; a second failure goes to the caller
+                logger.warning("redis command connection lost (%s), reconnecting", exc)
+                await self._cmd.close()
+                self._cmd = await self._open()
+                return await self._cmd.call(*args)
+
+    async def _listen(self):
+        channel_prefix = self._channel("")
+        delay = RECONNECT_DELAY
+        while True:
+            try:
+                reply = await self._sub.read()
+            except asyncio.CancelledError:
+                raise
+            except (ConnectionError, OSError, asyncio.IncompleteReadError, RedisError) as exc:
+                logger.warning("redis subscription lost (%s), reconnecting in %.1fs", exc, delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, MAX_RECONNECT_DELAY)
+                await self._resubscribe()
+                continue
+            delay = RECONNECT_DELAY
+            # subscribe/unsubscribe confirmations are ignored
+            if not isinstance(reply, list) or len(reply) != 3 or reply[0] != b"message":
+                continue
+            room = reply[1].decode()[len(channel_prefix):]
+            key, _, text = reply[2].decode().partition("\n")
+            try:
+                self._deliver(room, key or None, text)
+            except Exception:
+                logger.exception("delivering to room %s failed", room)
+
+    async def _keep_rooms_alive(self):
+        # a room with clients but no recent ops must not expire under them: its seqs
+        # would restart at 1 and connected clients would drop the new ops as seen
+        while True:
+            await asyncio.sleep(max(self.idle_ttl / 3, 1))
+            try:
+                await self.touch(*self.rooms)
+            except (ConnectionError, OSError, RedisError) as exc:
+                logger.warning("refreshing room TTLs failed (%s)", exc)
+
+    async def touch(self, *rooms: str):
+        """Restart the idle TTL of ``rooms``' keys."""
+        keys = [key for room in rooms for key in self._keys(room)]
+        if keys:
+            await self._call("EVAL", _TOUCH, len(keys), *keys, int(self.idle_ttl))
+
+    async def _resubscribe(self):
+        async with self._sub_lock:
+            await self._sub.close()
+            try:
+                self._sub = await self._open()
+                if self.rooms:
+                    self._sub.send("SUBSCRIBE", *(self._channel(room) for room in self.rooms))
+                    await self._sub.writer.drain()
+            except (ConnectionError, OSError, RedisError) as exc:
+                # the next read fails on the dead connection and we come back here
+                logger.warning("redis reconnect failed (%s)", exc)
+
+    async def _send_sub(self, *args):
+        # replies arrive on the listener task, so only write here
+        async with self._sub_lock:
+            try:
+                self._sub.send(*args)
+                await self._sub.writer.drain()
+            except (ConnectionError, OSError) as exc:
+                # the listener reconnects and resubscribes from self.rooms
+                logger.warning("redis subscription write failed (%s)", exc)
+
+    async def subscribe(self, room: str):
+        self.rooms.add(room)
+        await self._send_sub("SUBSCRIBE", self._channel(room))
+
+    async def unsubscribe(self, room: str):
+        self.rooms.discard(room)
+        await self._send_sub("UNSUBSCRIBE", self._channel(room))
+
+    async def publish(self, room: str, text: str, key: Optional[str] = None):
+        await self._call("PUBLISH", self._channel(room), f"{key or ''}\n{text}")
+
+    async def publish_op(self, room: str, op: dict, client: str = "") -> dict:
+        keys = self._keys(room)
+        args = (
+            self._channel(room), json.dumps(client), json.dumps(op, separators=(",", ":")),
+            "1" if op.get("kind") == "clear" else "0", self.max_ops, int(self.idle_ttl), uuid.uuid4().hex[:12],
+            _op_points(op), self.max_points,
+        )
+        try:
+            entry = await self._call("EVALSHA", self._script_sha, len(keys), *keys, *args)
+        except RedisError as exc:
+            if not str(exc).startswith("NOSCRIPT"):
+                raise
+            entry = await self._call("EVAL", _PUBLISH_OP, len(keys), *keys, *args)
+        return json.loads(entry)
+
+    async def ops_since(self, room: str, seq: int) -> List[dict]:
+        raw = await self._call("ZRANGEBYSCORE", self._keys(room)[1], f"({seq}", "+inf")
+        return [json.loads(item) for item in raw or []]
+
+    async def current_seq(self, room: str) -> int:
+        seq = await self._call("GET", self._keys(room)[0])
+        return int(seq) if seq else 0
+
+    async def epoch(self, room: str) -> str:
+        key = self._keys(room)[2]
+        await self._call("SET", key, uuid.uuid4().hex[:12], "NX", "EX", int(self.idle_ttl))
+        return (await self._call("GET", key)).decode()
+
+    async def set_affinity(self, room: str, worker: str, connections: int):
+        field = f"{room}|{worker}"
+        if connections:
+            await self._call("HSET", f"{self.prefix}:affinity", field, connections)
+        else:
+            await self._call("HDEL", f"{self.prefix}:affinity", field)
+
+    async def affinity(self) -> Dict[str, Dict[str, int]]:
+        raw = await self._call("HGETALL", f"{self.prefix}:affinity") or []
+        result: Dict[str, Dict[str, int]] = {}
+        pairs: List[Tuple[bytes, bytes]] = list(zip(raw[::2], raw[1::2]))
+        for field, count in pairs:
+            room, _, worker = field.decode().rpartition("|")
+            result.setdefault(room, {})[worker] = int(count)
+        return result
+
+def broker_from_url(url: str) -> Broker:
+    """Build a broker from ``memory://`` or ``redis://[:password@]host:port/db``."""
+    scheme = urlparse(url).scheme
+    if scheme in ("", "memory"):
+        return InMemoryBroker()
+    if scheme == "redis":
+        return RedisBroker.from_url(url)
+    raise ValueError(f"Unsupported broker URL: {url}")
@@ -1,23 +1,109 @@
-from sqlalchemy import create_engine
+# backend/app/db.py
+"""The one database engine, its session factory and the declarative Base.
+
+Configured from ``DATABASE_URL``; plain ``sqlite:///`` and ``postgres://``
+URLs are mapped to their async drivers (aiosqlite / asyncpg). Schema setup
+is done by ``init_db`` from the app's startup hook, not at import time.
+"""
+import os
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./whiteboard.db")
+DB_ECHO = os.getenv("DB_ECHO", "false").lower() in ("1", "true", "yes")
+# Connections kept open, and extra ones allowed under bursts
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Recycle server connections before proxies/poolers drop them
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Prepared statements cached per connection
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "256"))
+# How long a SQLite writer waits for the lock instead of failing with "database is locked"
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
 
-# File-based sqlite for local/dev. Change to your DB URL in production.
-SYNC_DATABASE_URL = "sqlite:///./whiteboard.db"
-ASYNC_DATABASE_URL = "sqlite+aiosqlite:///./whiteboard.db"
+def normalize_url(url: str) -> str:
+    """Map sync/legacy URLs to their async driver."""
+    if url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+    if url.startswith("postgresql://"):
+        url = "postgresql+asyncpg://" + url[len("postgresql://"):]
+    elif url.startswith("sqlite://"):
+        url = "sqlite+aiosqlite://" + url[len("sqlite://"):]
+    return url
 
-# synchronous engine (used for metadata.create_all)
-engine = create_engine(SYNC_DATABASE_URL, connect_args={"check_same_thread": False})
+def _engine_options(url) -> dict:
+    options = {"echo": DB_ECHO}
+    if url.get_backend_name() == "sqlite":
+        if url.database in (None, "", ":memory:"):
+            # in-memory databases live in a single connection; keep the dialect's StaticPool
+            return options
+        # aiosqlite defaults to NullPool, which reconnects (and re-prepares) on every session
+        options.update(
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            connect_args={
+                "cached_statements": DB_STATEMENT_CACHE_SIZE,
+                "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000,
+            },
+        )
+        return options
+    options.update(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+    )
+    if url.get_driver_name() == "asyncpg":
+        options["connect_args"] = {"prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE}
+    return options
 
-# async engine for async DB operations (used by endpoints)
-async_engine = create_async_engine(ASYNC_DATABASE_URL, future=True, echo=False)
+_url = make_url(normalize_url(DATABASE_URL))
+engine = create_async_engine(_url, **_engine_options(_url))
+
+if _url.get_backend_name() == "sqlite":
+    @event.listens_for(engine.sync_engine, "connect")
+    def _sqlite_pragmas(dbapi_connection, connection_record):
+        # WAL lets readers run alongside the single writer; NORMAL is durable in WAL mode
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.close()
 
-# async session factory
 AsyncSessionLocal = async_sessionmaker(
-    bind=async_engine,
+    bind=engine,
     class_=AsyncSession,
     expire_on_commit=False,
 )
 
 # Declarative base used by models.py
 Base = declarative_base()
+
+async def get_db():
+    """One session per request.
+
+    FastAPI resolves a dependency once per request, so ``get_current_user`` and
+    the endpoint it guards share this session.
+    """
+    async with AsyncSessionLocal() as session:
+        yield session
+
+async def init_db():
+    """Create missing tables, columns and indexes. Called once at startup."""
+    from . import models  # registers the tables on Base
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(models.add_missing_columns)
+
+async def close_db():
+    await engine.dispose()
@@ -2,16 +2,15 @@ from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 
-from . import db, models
+from . import db
 from .auth import router as auth_router
-from .routers import gallery, ai
+from .routers import gallery, ai, realtime, boards
+from .ws_manager import manager
+from .ai_jobs import job_manager
 
 # Create FastAPI app
 app = FastAPI(title="AI Whiteboard Backend")
 
-# Create database tables
-models.Base.metadata.create_all(bind=db.engine)
-
 # Allow frontend calls (if served separately during dev)
 app.add_middleware(
     CORSMiddleware,
@@ -25,6 +24,19 @@ app.add_middleware(
 app.include_router(auth_router)
 app.include_router(gallery.router)
 app.include_router(ai.router)
+app.include_router(realtime.router)
+app.include_router(boards.router)
+
+@app.on_event("startup")
+async def startup():
+    # Create missing tables/columns once per process start rather than at import
+    await db.init_db()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await manager.close()
+    job_manager.shutdown()
+    await db.close_db()
 
 # Serve frontend build (dist must exist inside backend/)
 app.mount("/", StaticFiles(directory="dist", html=True), name="static")
@@ -1,12 +1,86 @@
-from sqlalchemy import create_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import Column, DateTime, Index, Integer, LargeBinary, String, Text, func, inspect, text
+from sqlalchemy.orm import deferred
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./whiteboard.db"  # change to Postgres/MySQL in production
+from .db import Base
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+class User(Base):
+    __tablename__ = "users"
 
-Base = declarative_base()
+    id = Column(Integer, primary_key=True, index=True)
+    username = Column(String(128), unique=True, index=True, nullable=False)
+    hashed_password = Column(String(256), nullable=False)
+
+class Diagram(Base):
+    __tablename__ = "diagrams"
+
+    id = Column(Integer, primary_key=True, index=True)
+    owner = Column(String(128), index=True)
+    title = Column(String(256))
+    # legacy column: inline data URL for rows saved before the blob store
+    data_json = Column(Text)
+    # image payload lives in the blob store, addressed by its SHA-256
+    image_sha256 = Column(String(64), index=True)
+    image_type = Column(String(64))
+    image_size = Column(Integer)
+    thumb_sha256 = Column(String(64), index=True)
+    thumb_type = Column(String(64))
+    created_at = Column(DateTime, server_default=func.now())
+
+    __table_args__ = (
+        # keyset pagination: WHERE owner = ? ORDER BY created_at DESC, id DESC
+        Index("ix_diagrams_owner_created_id", "owner", "created_at", "id"),
+    )
+
+class Board(Base):
+    __tablename__ = "boards"
+
+    id = Column(Integer, primary_key=True, index=True)
+    owner = Column(String(128), index=True)
+    title = Column(String(256))
+    # packed vector.BoardDocument as of snapshot_seq; deferred so metadata queries skip it
+    snapshot = deferred(Column(LargeBinary))
+    snapshot_seq = Column(Integer, default=0)
+    element_count = Column(Integer, default=0)
+    # seq of the last op in the log; used for cache validation and optimistic locking
+    version = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime, server_default=func.now())
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        Index("ix_boards_owner_created_id", "owner", "created_at", "id"),
+    )
+
+class BoardOperation(Base):
+    """Op-log entry appended since the board's last snapshot (JSON of a schemas.BoardOp)."""
+    __tablename__ = "board_ops"
+
+    id = Column(Integer, primary_key=True)
+    board_id = Column(Integer, nullable=False)
+    seq = Column(Integer, nullable=False)
+    data = Column(Text, nullable=False)
+    created_at = Column(DateTime, server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_board_ops_board_seq", "board_id", "seq", unique=True),
+    )
+
+def add_missing_columns(conn):
+    """Bring existing tables up to date with nullable columns and indexes added since they were created.
+
+    ``create_all`` only creates missing tables, so older databases would
+    otherwise lack new columns. Runs on a connection inside the startup
+    transaction (see db.init_db).
+    """
+    inspector = inspect(conn)
+    existing_tables = set(inspector.get_table_names())
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        present = {col["name"] for col in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in present or not column.nullable:
+                continue
+            col_type = column.type.compile(dialect=conn.dialect)
+            conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}"))
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
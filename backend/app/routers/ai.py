@@ -1,11 +1,52 @@
-from fastapi import APIRouter, File, UploadFile
-import base64
+import asyncio
+
+from fastapi import APIRouter, File, Form, HTTPException, UploadFile, status
+from fastapi.responses import FileResponse, JSONResponse
+
+from app.ai_jobs import job_manager
 
 router = APIRouter(prefix="/api/ai", tags=["ai"])
 
+# How long /cleanup waits for its job before telling the client to poll
+CLEANUP_WAIT_SECONDS = 20
+
+def _guess_kind(upload: UploadFile) -> str:
+    content_type = (upload.content_type or "").lower()
+    return "vector" if content_type in ("application/json", "text/json") else "raster"
+
+def _result_response(job):
+    if job.status == "error":
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=job.error)
+    if job.status != "done":
+        return JSONResponse(job.to_dict(), status_code=status.HTTP_202_ACCEPTED)
+    if not job_manager.store.exists(job.result_digest):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Result expired")
+    return FileResponse(
+        job_manager.store.path(job.result_digest),
+        media_type=job.result_type,
+        headers={"ETag": f'"{job.result_digest}"', "X-Job-Id": job.id},
+    )
+
+@router.post("/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def submit_job(file: UploadFile = File(...), kind: str = Form(None)):
+    """Queue a cleanup job. ``kind`` is ``raster`` (images) or ``vector`` (board ops JSON)."""
+    job = await job_manager.submit(kind or _guess_kind(file), file)
+    return job.to_dict()
+
+@router.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    return job_manager.get(job_id).to_dict()
+
+@router.get("/jobs/{job_id}/result")
+async def job_result(job_id: str):
+    return _result_response(job_manager.get(job_id))
+
 @router.post("/cleanup")
 async def cleanup(image: UploadFile = File(...)):
-    # Just return same image base64 for now
-    data = await image.read()
-    encoded = "data:image/png;base64," + base64.b64encode(data).decode()
-    return {"cleaned_png": encoded}
+    """Clean up an image and return it as binary, or 202 + job status if it takes too long."""
+    job = await job_manager.submit(_guess_kind(image), image)
+    try:
+        await job_manager.wait(job, CLEANUP_WAIT_SECONDS)
+    except asyncio.TimeoutError:
+        pass
+    return _result_response(job)
@@ -0,0 +1,162 @@
+# backend/app/routers/boards.py
+import math
+from bisect import bisect_right
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Path, Query, status
+from fastapi.responses import Response
+from pydantic import BaseModel
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from app.db import get_db
+from app import models
+from app.auth import get_current_user
+from app.board_store import board_store
+from app.cache import TTLCache
+from app.vector import COORDINATE_LIMIT, TILE_SIZE
+from app.schemas import BoardOps
+
+router = APIRouter(prefix="/api/boards", tags=["boards"])
+
+MAX_ELEMENTS_PER_QUERY = 5000
+MIN_ZOOM, MAX_ZOOM = -2, 12
+# Tile indices past this cannot hold elements at any zoom (and would overflow float math)
+MAX_TILE_INDEX = int(COORDINATE_LIMIT // (TILE_SIZE * 2.0 ** MIN_ZOOM))
+
+# (board id, version, z, x, y) -> PNG bytes
+_tiles = TTLCache(maxsize=1024, ttl=600)
+
+class BoardIn(BaseModel):
+    title: str
+
+class BoardOut(BaseModel):
+    id: int
+    title: str
+    element_count: int
+    version: int
+    snapshot_seq: Optional[int] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        orm_mode = True
+
+def _parse_bbox(raw: str) -> Tuple[float, float, float, float]:
+    try:
+        x0, y0, x1, y1 = (float(v) for v in raw.split(","))
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="bbox must be x0,y0,x1,y1")
+    if not all(math.isfinite(v) for v in (x0, y0, x1, y1)):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="bbox must be finite")
+    return min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)
+
+@router.post("/", response_model=BoardOut)
+async def create_board(payload: BoardIn, db: AsyncSession = Depends(get_db), user=Depends(get_current_user)):
+    board = models.Board(owner=user.username, title=payload.title, element_count=0, version=0, snapshot_seq=0)
+    db.add(board)
+    await db.commit()
+    await db.refresh(board)
+    return board
+
+@router.get("/", response_model=List[BoardOut])
+async def list_boards(db: AsyncSession = Depends(get_db), user=Depends(get_current_user)):
+    result = await db.execute(
+        select(models.Board)
+        .where(models.Board.owner == user.username)
+        .order_by(models.Board.created_at.desc(), models.Board.id.desc())
+    )
+    return result.scalars().all()
+
+@router.get("/{board_id}")
+async def get_board(board_id: int, db: AsyncSession = Depends(get_db), user=Depends(get_current_user)):
+    board = await board_store.get_owned(db, board_id, user.username)
+    doc = await board_store.load(db, board)
+    return {**BoardOut.from_orm(board).dict(), "extent": doc.extent()}
+
+@router.delete("/{board_id}")
+async def delete_board(board_id: int, db: AsyncSession = Depends(get_db), user=Depends(get_current_user)):
+    await board_store.get_owned(db, board_id, user.username)
+    await board_store.delete(db, board_id)
+    return {"ok": True}
+
+@router.post("/{board_id}/elements")
+async def add_elements(board_id: int, payload: BoardOps, db: AsyncSession = Depends(get_db), user=Depends(get_current_user)):
+    """Delta save: append ops (same shape as /ws/board ops) to the board's log."""
+    ops = [op.dict(exclude_none=True) for op in payload.ops]
+    version, ids = await board_store.append(db, board_id, user.username, ops)
+    return {"version": version, "ids": ids}
+
+@router.get("/{board_id}/ops")
+async def board_ops(
+    board_id: int,
+    since: int = Query(0, ge=0),
+    db: AsyncSession = Depends(get_db),
+    user=Depends(get_current_user),
+):
+    """Ops logged after version ``since``; 410 once they are folded into the snapshot."""
+    board = await board_store.get_owned(db, board_id, user.username)
+    ops = await board_store.ops_since(db, board, since)
+    if ops is None:
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail="Ops compacted, reload the board elements")
+    return {"version": board.version, "ops": ops}
+
+@router.get("/{board_id}/elements")
+async def query_elements(
+    board_id: int,
+    bbox: Optional[str] = None,
+    after: int = Query(-1, ge=-1),
+    limit: int = Query(MAX_ELEMENTS_PER_QUERY, ge=1, le=MAX_ELEMENTS_PER_QUERY),
+    db: AsyncSession = Depends(get_db),
+    user=Depends(get_current_user),
+):
+    """Elements intersecting ``bbox=x0,y0,x1,y1`` (whole board if omitted), in draw order.
+
+    When ``truncated`` is set, fetch the next page with ``after`` = the last element's id.
+    """
+    board = await board_store.get_owned(db, board_id, user.username)
+    doc = await board_store.load(db, board)
+    if bbox:
+        ids = doc.query(_parse_bbox(bbox))
+        ids = ids[bisect_right(ids, after):]
+    else:
+        ids = range(after + 1, len(doc))
+    return {
+        "version": board.version,
+        "truncated": len(ids) > limit,
+        "elements": [doc.element(i) for i in ids[:limit]],
+    }
+
+@router.get("/{board_id}/tiles/{zoom}/{tx}/{ty}.png")
+async def board_tile(
+    board_id: int,
+    zoom: int,
+    tx: int = Path(..., ge=-MAX_TILE_INDEX, le=MAX_TILE_INDEX),
+    ty: int = Path(..., ge=-MAX_TILE_INDEX, le=MAX_TILE_INDEX),
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db),
+    user=Depends(get_current_user),
+):
+    """256px tile; at zoom z it covers 256 * 2**z canvas pixels starting at (tx, ty) * that span."""
+    if not MIN_ZOOM <= zoom <= MAX_ZOOM:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="zoom out of range")
+    span = TILE_SIZE * 2.0 ** zoom
+    if max(abs(tx), abs(ty)) > COORDINATE_LIMIT / span:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="tile out of range")
+    board = await board_store.get_owned(db, board_id, user.username)
+    etag = f'"{board_id}-{board.version}-{zoom}-{tx}-{ty}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if if_none_match == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    key = (board_id, board.version, zoom, tx, ty)
+    png = _tiles.get(key)
+    if png is None:
+        doc = await board_store.load(db, board)
+        png = await run_in_threadpool(doc.render_tile, zoom, tx, ty)
+        if png is None:
+            raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED, detail="Tile rendering needs Pillow")
+        _tiles.set(key, png)
+    return Response(png, media_type="image/png", headers=headers)
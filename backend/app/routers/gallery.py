@@ -1,51 +1,287 @@
-# backend/app/routers/gallery.py
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
-from pydantic import BaseModel
-from typing import List
-
-from app.db import AsyncSessionLocal
-from app import models
-from app.auth import get_current_user
-
-router = APIRouter(prefix="/api/gallery", tags=["gallery"])
-
-class DiagramIn(BaseModel):
-    title: str
-    data: str  # Data URL (base64 png)
-
-class DiagramOut(BaseModel):
-    id: int
-    title: str
-    data_json: str
-
-    class Config:
-        orm_mode = True
-
-async def get_db():
-    async with AsyncSessionLocal() as session:
-        yield session
-
-@router.post("/", response_model=DiagramOut)
-async def save_diagram(payload: DiagramIn, db: AsyncSession = Depends(get_db), user=Depends(get_current_user)):
-    diag = models.Diagram(owner=user.username, title=payload.title, data_json=payload.data)
-    db.add(diag)
-    await db.commit()
-    await db.refresh(diag)
-    return diag
-
-@router.get("/", response_model=List[DiagramOut])
-async def list_diagrams(db: AsyncSession = Depends(get_db), user=Depends(get_current_user)):
-    result = await db.execute(select(models.Diagram).where(models.Diagram.owner == user.username))
-    return result.scalars().all()
-
-@router.delete("/{diagram_id}")
-async def delete_diagram(diagram_id: int, db: AsyncSession = Depends(get_db), user=Depends(get_current_user)):
-    result = await db.execute(select(models.Diagram).where(models.Diagram.id == diagram_id, models.Diagram.owner == user.username))
-    diag = result.scalars().first()
-    if not diag:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Diagram not found")
-    await db.delete(diag)
-    await db.commit()
-    return {"ok": True}
+# backend/app/routers/gallery.py
+import asyncio
+import base64
+import hashlib
+import re
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+import aiofiles
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
+from fastapi.responses import Response, StreamingResponse
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel
+
+from app.db import get_db
+from app import models
+from app.auth import get_current_user
+from app.blobstore import blob_store, decode_data_url
+from app.thumbnails import create_thumbnail
+
+router = APIRouter(prefix="/api/gallery", tags=["gallery"])
+
+# Bytes read per chunk when streaming an image
+CHUNK_SIZE = 64 * 1024
+# Gallery page sizes
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+# Striped locks keyed by image digest: a save holds one from put to commit and
+# a delete holds it from its refcount check to unlink, so a delete can't
+# remove a blob that an in-flight save of the same image is about to use
+_blob_locks = [asyncio.Lock() for _ in range(64)]
+
+def _blob_lock(digest: str) -> asyncio.Lock:
+    return _blob_locks[int(digest[:8], 16) % len(_blob_locks)]
+
+class DiagramIn(BaseModel):
+    title: str
+    data: str  # Data URL (base64 png)
+
+class DiagramOut(BaseModel):
+    id: int
+    title: str
+    image_url: str
+    image_type: Optional[str] = None
+    image_size: Optional[int] = None
+    thumbnail_url: str
+    created_at: Optional[datetime] = None
+
+class DiagramPage(BaseModel):
+    items: List[DiagramOut]
+    next_cursor: Optional[str] = None
+
+def _to_out(diag) -> DiagramOut:
+    return DiagramOut(
+        id=diag.id,
+        title=diag.title,
+        image_url=f"{router.prefix}/{diag.id}/image",
+        image_type=diag.image_type,
+        image_size=diag.image_size,
+        thumbnail_url=f"{router.prefix}/{diag.id}/thumbnail",
+        created_at=diag.created_at,
+    )
+
+def _encode_cursor(created_at: datetime, diagram_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{diagram_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, diagram_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(diagram_id)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+def _parse_range(header: str, size: int) -> Tuple[int, int]:
+    """Parse a single ``bytes=`` range into inclusive (start, end) offsets."""
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", header.strip())
+    if match is None or not (match.group(1) or match.group(2)):
+        raise ValueError("unsupported range")
+    first, last = match.groups()
+    if not first:
+        start, end = max(0, size - int(last)), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        raise ValueError("unsatisfiable range")
+    return start, end
+
+async def _iter_file(path: str, start: int, length: int):
+    async with aiofiles.open(path, "rb") as fh:
+        await fh.seek(start)
+        while length > 0:
+            chunk = await fh.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+def _serve_blob(digest: str, media_type: Optional[str], range_header: Optional[str], if_none_match: Optional[str]):
+    etag = f'"{digest}"'
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, max-age=86400",
+    }
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    path = blob_store.path(digest)
+    size = blob_store.size(digest)
+    if size is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image missing from blob store")
+    media_type = media_type or "application/octet-stream"
+
+    if range_header:
+        try:
+            start, end = _parse_range(range_header, size)
+        except ValueError:
+            return Response(
+                status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                headers={**headers, "Content-Range": f"bytes */{size}"},
+            )
+        length = end - start + 1
+        headers.update({"Content-Range": f"bytes {start}-{end}/{size}", "Content-Length": str(length)})
+        return StreamingResponse(
+            _iter_file(path, start, length),
+            status_code=status.HTTP_206_PARTIAL_CONTENT,
+            media_type=media_type,
+            headers=headers,
+        )
+
+    headers["Content-Length"] = str(size)
+    return StreamingResponse(_iter_file(path, 0, size), media_type=media_type, headers=headers)
+
+async def _ensure_blob(db: AsyncSession, diag):
+    """Move the inline image of a row saved before the blob store, once."""
+    if diag.image_sha256:
+        return
+    try:
+        mime, raw = decode_data_url(diag.data_json or "")
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Diagram has no image")
+    diag.image_sha256 = await run_in_threadpool(blob_store.put, raw)
+    diag.image_type = mime
+    diag.image_size = len(raw)
+    diag.data_json = None
+    await db.commit()
+
+async def _get_owned(db: AsyncSession, diagram_id: int, owner: str):
+    result = await db.execute(select(models.Diagram).where(models.Diagram.id == diagram_id, models.Diagram.owner == owner))
+    diag = result.scalars().first()
+    if not diag:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Diagram not found")
+    return diag
+
+@router.post("/", response_model=DiagramOut)
+async def save_diagram(payload: DiagramIn, db: AsyncSession = Depends(get_db), user=Depends(get_current_user)):
+    try:
+        mime, raw = decode_data_url(payload.data)
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+    async with _blob_lock(hashlib.sha256(raw).hexdigest()):
+        digest = await run_in_threadpool(blob_store.put, raw)
+        thumb = await create_thumbnail(raw, blob_store)
+        diag = models.Diagram(
+            owner=user.username,
+            title=payload.title,
+            image_sha256=digest,
+            image_type=mime,
+            image_size=len(raw),
+            thumb_type=thumb[0] if thumb else None,
+            thumb_sha256=thumb[1] if thumb else None,
+        )
+        db.add(diag)
+        await db.commit()
+        # another worker may have deleted the last identical diagram (and its
+        # blobs) between our put and commit; now that our row exists, restore them
+        if not blob_store.exists(digest):
+            await run_in_threadpool(blob_store.put, raw)
+        if thumb and not blob_store.exists(thumb[1]):
+            await create_thumbnail(raw, blob_store)
+    await db.refresh(diag)
+    return _to_out(diag)
+
+@router.get("/", response_model=DiagramPage)
+async def list_diagrams(
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db),
+    user=Depends(get_current_user),
+):
+    """Newest-first page of the user's diagrams (metadata only).
+
+    Pass the returned ``next_cursor`` back to get the following page; the
+    query walks ix_diagrams_owner_created_id so every page costs the same.
+    """
+    Diagram = models.Diagram
+    query = (
+        select(Diagram.id, Diagram.title, Diagram.image_type, Diagram.image_size, Diagram.created_at)
+        .where(Diagram.owner == user.username)
+        .order_by(Diagram.created_at.desc(), Diagram.id.desc())
+        .limit(limit + 1)
+    )
+    if cursor:
+        created_at, diagram_id = _decode_cursor(cursor)
+        # compare against the stored value of the cursor row so the DB's own
+        # timestamp format is used; the decoded one only covers deleted rows
+        fallback = created_at
+        if db.bind.dialect.name == "sqlite":
+            # CURRENT_TIMESTAMP is stored as 'YYYY-MM-DD HH:MM:SS' text while a bound
+            # datetime carries '.ffffff', so equal instants would compare as later
+            fallback = func.datetime(created_at)
+        anchor = func.coalesce(
+            select(Diagram.created_at)
+            .where(Diagram.id == diagram_id, Diagram.owner == user.username)
+            .scalar_subquery(),
+            fallback,
+        )
+        query = query.where(or_(
+            Diagram.created_at < anchor,
+            and_(Diagram.created_at == anchor, Diagram.id < diagram_id),
+        ))
+    rows = (await db.execute(query)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1].created_at, rows[-1].id)
+    return DiagramPage(items=[_to_out(row) for row in rows], next_cursor=next_cursor)
+
+@router.get("/{diagram_id}/image")
+async def get_diagram_image(
+    diagram_id: int,
+    range_header: Optional[str] = Header(None, alias="Range"),
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db),
+    user=Depends(get_current_user),
+):
+    diag = await _get_owned(db, diagram_id, user.username)
+    await _ensure_blob(db, diag)
+    return _serve_blob(diag.image_sha256, diag.image_type, range_header, if_none_match)
+
+@router.get("/{diagram_id}/thumbnail")
+async def get_diagram_thumbnail(
+    diagram_id: int,
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db),
+    user=Depends(get_current_user),
+):
+    diag = await _get_owned(db, diagram_id, user.username)
+    await _ensure_blob(db, diag)
+    if not diag.thumb_sha256 and blob_store.exists(diag.image_sha256):
+        # older rows get their thumbnail on first request, then it is cached
+        raw = await run_in_threadpool(blob_store.get, diag.image_sha256)
+        thumb = await create_thumbnail(raw, blob_store)
+        if thumb:
+            diag.thumb_type, diag.thumb_sha256 = thumb
+            await db.commit()
+    if diag.thumb_sha256:
+        return _serve_blob(diag.thumb_sha256, diag.thumb_type, None, if_none_match)
+    # no thumbnail could be made (e.g. Pillow missing): send the full image
+    return _serve_blob(diag.image_sha256, diag.image_type, None, if_none_match)
+
+@router.delete("/{diagram_id}")
+async def delete_diagram(diagram_id: int, db: AsyncSession = Depends(get_db), user=Depends(get_current_user)):
+    diag = await _get_owned(db, diagram_id, user.username)
+    digests = [d for d in (diag.image_sha256, diag.thumb_sha256) if d]
+    await db.delete(diag)
+    await db.commit()
+    if not digests:
+        return {"ok": True}
+    # the thumbnail is derived from the image, so the image digest covers both
+    async with _blob_lock(digests[0]):
+        for digest in digests:
+            # blobs are shared between identical diagrams; drop it with the last reference
+            remaining = await db.scalar(
+                select(func.count(models.Diagram.id)).where(
+                    or_(models.Diagram.image_sha256 == digest, models.Diagram.thumb_sha256 == digest)
+                )
+            )
+            if not remaining:
+                await run_in_threadpool(blob_store.delete, digest)
+    return {"ok": True}
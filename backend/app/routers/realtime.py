@@ -0,0 +1,103 @@
+# backend/app/routers/realtime.py
+import json
+import uuid
+from typing import List, Optional
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from pydantic import ValidationError
+
+from app.schemas import BoardOp, CursorPosition
+from app.ws_manager import manager
+
+router = APIRouter(tags=["realtime"])
+
+def _parse_op(raw) -> Optional[dict]:
+    try:
+        op = BoardOp.parse_obj(raw)
+    except ValidationError:
+        return None
+    data = op.dict(exclude_none=True)
+    if op.kind == "clear":
+        return {"kind": "clear"}
+    return data
+
+def _parse_cursor(raw: dict) -> Optional[CursorPosition]:
+    # json.loads accepts NaN/Infinity but browsers' JSON.parse does not; one such
+    # cursor would spoil the whole batch frame it is queued in
+    try:
+        return CursorPosition.parse_obj(raw)
+    except ValidationError:
+        return None
+
+@router.websocket("/ws/board/{room}")
+async def board_socket(websocket: WebSocket, room: str, since: int = 0, epoch: Optional[str] = None):
+    """Stroke-level board sync.
+
+    On connect the client gets a ``sync`` message replaying every retained op
+    after ``since``; afterwards each ``op`` it sends is sequenced, logged and
+    fanned out to the room. ``cursor`` messages are relayed but not logged.
+
+    ``reset`` in the sync means the room's log restarted since the client's
+    ``since``/``epoch`` (server restart, idle expiry), so it must drop its
+    state and replay ``ops`` from scratch. ``truncated`` means older ops have
+    been dropped from the log and the replay is incomplete.
+    """
+    client_id = uuid.uuid4().hex[:12]
+    await manager.connect(room, websocket)
+    try:
+        room_epoch = await manager.epoch(room)
+        seq = await manager.current_seq(room)
+        reset = since > seq or (epoch is not None and epoch != room_epoch)
+        if reset:
+            since = 0
+        ops: List[dict] = await manager.ops_since(room, since)
+        if ops:
+            # a gap is expected only when the log restarts at a clear
+            truncated = ops[0]["seq"] > since + 1 and ops[0]["op"].get("kind") != "clear"
+        else:
+            truncated = since < seq
+        await manager.send(websocket, {
+            "type": "sync",
+            "client": client_id,
+            "epoch": room_epoch,
+            # taken from the ops actually replayed, so nothing between is skipped
+            "seq": ops[-1]["seq"] if ops else (seq if truncated else since),
+            "reset": reset,
+            "truncated": truncated,
+            "ops": ops,
+        })
+        while True:
+            try:
+                msg = json.loads(await websocket.receive_text())
+            except ValueError:
+                await manager.send(websocket, {"type": "error", "detail": "invalid json"})
+                continue
+            kind = msg.get("type") if isinstance(msg, dict) else None
+            if kind == "op":
+                op = _parse_op(msg.get("op"))
+                if op is None:
+                    await manager.send(websocket, {"type": "error", "detail": "invalid op"})
+                    continue
+                await manager.publish_op(room, op, client_id)
+            elif kind == "cursor":
+                cursor = _parse_cursor(msg)
+                if cursor is None:
+                    # dropped quietly: cursors are sent at pointer rate
+                    continue
+                await manager.broadcast(room, {
+                    "type": "cursor",
+                    "client": client_id,
+                    "x": cursor.x,
+                    "y": cursor.y,
+                }, key=f"cursor:{client_id}")
+    except WebSocketDisconnect:
+        pass
+    finally:
+        manager.disconnect(room, websocket)
+
+@router.get("/api/realtime/stats")
+async def realtime_stats():
+    """Connections per room on this worker, plus the room-to-worker map from the broker."""
+    stats = manager.local_stats()
+    stats["affinity"] = await manager.broker.affinity()
+    return stats
@@ -1,5 +1,15 @@
 # backend/app/schemas.py
-from pydantic import BaseModel
+from typing import List, Optional
+
+from pydantic import BaseModel, confloat, conlist, constr
+
+# Guard against a single message carrying an unbounded stroke
+MAX_POINTS_PER_OP = 20000
+# Canvas coordinates and stroke widths are finite and bounded (json.loads accepts NaN/Infinity)
+MAX_COORDINATE = 1e7
+MAX_STROKE_WIDTH = 500
+
+Coordinate = confloat(ge=-MAX_COORDINATE, le=MAX_COORDINATE, allow_inf_nan=False)
 
 class UserCreate(BaseModel):
     username: str
@@ -12,3 +22,21 @@ class Token(BaseModel):
 class DiagramCreate(BaseModel):
     title: str
     data: str
+
+class BoardOp(BaseModel):
+    """One drawing operation, as sent over /ws/board and stored for boards."""
+    kind: constr(regex="^(stroke|shape|clear)$")
+    tool: constr(regex="^(pen|eraser|rect|ellipse|line|arrow|text)$") = "pen"
+    color: constr(max_length=32) = "#000000"
+    width: confloat(gt=0, le=MAX_STROKE_WIDTH, allow_inf_nan=False) = 2
+    # flat [x0, y0, x1, y1, ...]; shapes send their two corner points
+    points: conlist(Coordinate, max_items=MAX_POINTS_PER_OP * 2) = []
+    text: Optional[constr(max_length=1000)] = None
+
+class CursorPosition(BaseModel):
+    """A pointer position relayed over /ws/board (not logged)."""
+    x: Coordinate
+    y: Coordinate
+
+class BoardOps(BaseModel):
+    ops: List[BoardOp]
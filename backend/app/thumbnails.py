@@ -0,0 +1,55 @@
+# backend/app/thumbnails.py
+"""Small gallery previews generated off the event loop.
+
+Pillow is optional: without it ``make_thumbnail`` returns ``None`` and the
+gallery falls back to the full image.
+"""
+import asyncio
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover - optional dependency
+    Image = None
+
+THUMBNAIL_SIZE = (320, 240)
+THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", "2"))
+
+# Pillow releases the GIL while resampling/encoding, so threads are enough
+_executor = ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS, thread_name_prefix="thumbnail")
+
+def make_thumbnail(data: bytes, size: Tuple[int, int] = THUMBNAIL_SIZE) -> Optional[Tuple[str, bytes]]:
+    """Return ``(mime, bytes)`` for a preview of ``data``, or None if it cannot be made."""
+    if Image is None:
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            img.thumbnail(size)
+            if img.mode not in ("RGB", "RGBA"):
+                img = img.convert("RGBA")
+            out = io.BytesIO()
+            try:
+                img.save(out, format="WEBP", quality=80, method=4)
+                return "image/webp", out.getvalue()
+            except (KeyError, OSError):
+                # Pillow built without WebP
+                out = io.BytesIO()
+                img.save(out, format="PNG", optimize=True)
+                return "image/png", out.getvalue()
+    except Exception:
+        return None
+
+def _build_and_store(data: bytes, store) -> Optional[Tuple[str, str]]:
+    thumb = make_thumbnail(data)
+    if thumb is None:
+        return None
+    mime, payload = thumb
+    return mime, store.put(payload)
+
+async def create_thumbnail(data: bytes, store) -> Optional[Tuple[str, str]]:
+    """Render and store a thumbnail on the worker pool; returns ``(mime, digest)``."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, _build_and_store, data, store)
@@ -0,0 +1,347 @@
+# backend/app/vector.py
+"""Server-side vector model of a board.
+
+Elements (the pen/eraser strokes and rect/ellipse/line/arrow/text shapes
+CanvasBoard draws) live in parallel typed arrays rather than per-element
+dicts, with a uniform grid index over their bounding boxes. Viewport queries
+and tile renders therefore only touch elements near the requested region.
+
+Storage is append-only, and each document object only sees its first
+``size`` elements. ``fork`` therefore hands a writer a document that shares
+storage with the original, while readers of the original (possibly in other
+threads) keep a stable view. A clear swaps in fresh storage instead of
+emptying the shared one.
+"""
+import copy
+import io
+import math
+import struct
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+try:
+    from PIL import Image, ImageDraw
+except ImportError:  # pragma: no cover - optional dependency
+    Image = None
+
+TOOLS = ("pen", "eraser", "rect", "ellipse", "line", "arrow", "text")
+KINDS = ("stroke", "shape")
+# Side of a spatial index cell, in canvas pixels
+GRID_CELL = 256
+# Elements spanning more cells than this are kept in a side list instead
+MAX_CELLS_PER_ELEMENT = 64
+TILE_SIZE = 256
+# Rough text extent used for bounding boxes (matches the 18px font on the canvas)
+TEXT_HEIGHT = 18
+TEXT_CHAR_WIDTH = 10
+ARROW_HEAD = 10
+# Stored coordinates/widths are float32; keep them (and padded bboxes) well inside its range
+COORDINATE_LIMIT = 1e30
+# Colour indices, text lengths and colour names are packed as uint16 / uint16 / uint8
+MAX_COLORS = 0x10000
+MAX_TEXT_BYTES = 0xFFFF
+MAX_COLOR_BYTES = 0xFF
+
+_MAGIC = b"WBD1"
+_HEADER = struct.Struct("<4sII")          # magic, element count, palette size
+_ELEMENT = struct.Struct("<BBHf4fIH")     # kind, tool, color, width, bbox, npoints, text bytes
+
+BBox = Tuple[float, float, float, float]
+
+def _cell_range(bbox: BBox) -> Tuple[int, int, int, int]:
+    x0, y0, x1, y1 = bbox
+    return (math.floor(x0 / GRID_CELL), math.floor(y0 / GRID_CELL),
+            math.floor(x1 / GRID_CELL), math.floor(y1 / GRID_CELL))
+
+def _cell_count(cells: Tuple[int, int, int, int]) -> int:
+    cx0, cy0, cx1, cy1 = cells
+    return (cx1 - cx0 + 1) * (cy1 - cy0 + 1)
+
+def _cells(cells: Tuple[int, int, int, int]) -> Iterable[Tuple[int, int]]:
+    cx0, cy0, cx1, cy1 = cells
+    for cx in range(cx0, cx1 + 1):
+        for cy in range(cy0, cy1 + 1):
+            yield cx, cy
+
+class BoardDocument:
+    def __init__(self):
+        self.kinds = array("B")
+        self.tools = array("B")
+        self.colors = array("H")        # index into palette
+        self.widths = array("f")
+        self.bboxes = array("f")        # 4 per element
+        self.offsets = array("I")       # start of each element in points
+        self.counts = array("I")        # number of (x, y) pairs
+        self.points = array("f")
+        self.texts: Dict[int, str] = {}
+        self.palette: List[str] = []
+        self._palette_index: Dict[str, int] = {}
+        self.grid: Dict[Tuple[int, int], List[int]] = {}
+        self.oversized: List[int] = []
+        # elements visible through this object; the shared storage may hold more
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def clear(self):
+        # new storage, so documents sharing the old one are unaffected
+        self.__init__()
+
+    def fork(self) -> "BoardDocument":
+        """A document to append to without changing what this one shows.
+
+        Shares storage (O(1)) when this document is at its end, which is the
+        normal case. Otherwise, e.g. after a failed save appended past it, it
+        copies the first ``size`` elements.
+        """
+        if len(self.kinds) == self.size:
+            return copy.copy(self)
+        return self.copy()
+
+    def copy(self) -> "BoardDocument":
+        """Independent copy of the visible elements."""
+        n = self.size
+        doc = BoardDocument()
+        doc.kinds, doc.tools, doc.colors = self.kinds[:n], self.tools[:n], self.colors[:n]
+        doc.widths, doc.bboxes = self.widths[:n], self.bboxes[: n * 4]
+        doc.offsets, doc.counts = self.offsets[:n], self.counts[:n]
+        doc.points = self.points[: self.offsets[n - 1] + self.counts[n - 1] * 2] if n else array("f")
+        doc.texts = {index: text for index, text in list(self.texts.items()) if index < n}
+        doc.palette = list(self.palette)
+        doc._palette_index = dict(self._palette_index)
+        # ids in each cell are ascending
+        grid = ((cell, ids[: bisect_left(ids, n)]) for cell, ids in list(self.grid.items()))
+        doc.grid = {cell: ids for cell, ids in grid if ids}
+        doc.oversized = [index for index in self.oversized if index < n]
+        doc.size = n
+        return doc
+
+    def _color(self, color: str) -> int:
+        index = self._palette_index.get(color)
+        if index is None:
+            self._check_color(color)
+            index = self._palette_index[color] = len(self.palette)
+            self.palette.append(color)
+        return index
+
+    def _check_color(self, color: str):
+        if color in self._palette_index:
+            return
+        if len(self.palette) >= MAX_COLORS:
+            raise ValueError(f"board palette is full ({MAX_COLORS} colours)")
+        if len(color.encode()) > MAX_COLOR_BYTES:
+            raise ValueError("colour name too long")
+
+    @staticmethod
+    def _bbox(kind: str, tool: str, width: float, coords: List[float], text: Optional[str]) -> BBox:
+        xs, ys = coords[0::2], coords[1::2]
+        x0, y0, x1, y1 = min(xs), min(ys), max(xs), max(ys)
+        if tool == "text":
+            return x0, y0 - TEXT_HEIGHT, x0 + TEXT_CHAR_WIDTH * len(text or ""), y0 + 4
+        pad = width / 2 + (ARROW_HEAD if tool == "arrow" else 0)
+        return x0 - pad, y0 - pad, x1 + pad, y1 + pad
+
+    def add(self, op: dict) -> Optional[int]:
+        """Append a board op; returns the element id (``None`` for clears and empty ops).
+
+        Raises ValueError for ops that cannot be stored, leaving the document unchanged.
+        """
+        if op.get("kind") == "clear":
+            self.clear()
+            return None
+        coords = list(op.get("points") or [])
+        if len(coords) < 2:
+            return None
+        coords = [float(v) for v in coords[: len(coords) // 2 * 2]]
+        kind, tool = op.get("kind", "stroke"), op.get("tool", "pen")
+        width = float(op.get("width", 2))
+        text = op.get("text")
+        color = op.get("color", "#000000")
+        # validate everything before touching the arrays so a bad op leaves no partial element
+        if kind not in KINDS or tool not in TOOLS:
+            raise ValueError(f"unknown element {kind}/{tool}")
+        if not all(math.isfinite(v) and abs(v) <= COORDINATE_LIMIT for v in coords):
+            raise ValueError("points must be finite and within range")
+        if not (math.isfinite(width) and 0 <= width <= COORDINATE_LIMIT):
+            raise ValueError("width must be finite and non-negative")
+        if text and len(text.encode()) > MAX_TEXT_BYTES:
+            raise ValueError("text too long")
+        self._check_color(color)
+        bbox = self._bbox(kind, tool, width, coords, text)
+        if len(self.kinds) != self.size:
+            raise RuntimeError("document was forked; append to the fork")
+
+        index = self.size
+        self.kinds.append(KINDS.index(kind))
+        self.tools.append(TOOLS.index(tool))
+        self.colors.append(self._color(color))
+        self.widths.append(width)
+        self.bboxes.extend(bbox)
+        self.offsets.append(len(self.points))
+        self.counts.append(len(coords) // 2)
+        self.points.extend(coords)
+        if text:
+            self.texts[index] = text
+        self._index(index, bbox)
+        self.size += 1
+        return index
+
+    def _index(self, index: int, bbox: BBox):
+        cells = _cell_range(bbox)
+        if _cell_count(cells) > MAX_CELLS_PER_ELEMENT:
+            self.oversized.append(index)
+            return
+        for cell in _cells(cells):
+            self.grid.setdefault(cell, []).append(index)
+
+    def bbox(self, index: int) -> BBox:
+        return tuple(self.bboxes[index * 4: index * 4 + 4])
+
+    def element(self, index: int) -> dict:
+        start = self.offsets[index]
+        data = {
+            "id": index,
+            "kind": KINDS[self.kinds[index]],
+            "tool": TOOLS[self.tools[index]],
+            "color": self.palette[self.colors[index]],
+            "width": self.widths[index],
+            "points": self.points[start: start + self.counts[index] * 2].tolist(),
+            "bbox": list(self.bbox(index)),
+        }
+        if index in self.texts:
+            data["text"] = self.texts[index]
+        return data
+
+    def query(self, bbox: BBox) -> List[int]:
+        """Ids of elements whose bounding box intersects ``bbox``, in draw order."""
+        x0, y0, x1, y1 = bbox
+        size = self.size
+        cells = _cell_range(bbox)
+        if _cell_count(cells) > len(self.grid):
+            # huge viewport: walking the occupied cells is cheaper (on a snapshot, as a fork may add cells)
+            buckets = [ids for cell, ids in list(self.grid.items())
+                       if cells[0] <= cell[0] <= cells[2] and cells[1] <= cell[1] <= cells[3]]
+        else:
+            buckets = [self.grid[cell] for cell in _cells(cells) if cell in self.grid]
+        buckets.append(self.oversized)
+        found: Set[int] = set()
+        for ids in buckets:
+            for index in ids:
+                if index >= size or index in found:
+                    continue
+                ex0, ey0, ex1, ey1 = self.bbox(index)
+                if ex0 <= x1 and ex1 >= x0 and ey0 <= y1 and ey1 >= y0:
+                    found.add(index)
+        return sorted(found)
+
+    def extent(self) -> Optional[BBox]:
+        if not self.size:
+            return None
+        b = self.bboxes[: self.size * 4]
+        return min(b[0::4]), min(b[1::4]), max(b[2::4]), max(b[3::4])
+
+    def to_bytes(self) -> bytes:
+        size = self.size
+        # taken after size, so it covers every colour those elements use
+        palette = list(self.palette)
+        out = io.BytesIO()
+        out.write(_HEADER.pack(_MAGIC, size, len(palette)))
+        for color in palette:
+            raw = color.encode()
+            out.write(struct.pack("<B", len(raw)) + raw)
+        for index in range(size):
+            text = self.texts.get(index, "").encode()
+            out.write(_ELEMENT.pack(
+                self.kinds[index], self.tools[index], self.colors[index], self.widths[index],
+                *self.bbox(index), self.counts[index], len(text),
+            ))
+            start = self.offsets[index]
+            out.write(self.points[start: start + self.counts[index] * 2].tobytes())
+            out.write(text)
+        return out.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data: Optional[bytes]) -> "BoardDocument":
+        doc = cls()
+        if not data:
+            return doc
+        view = memoryview(data)
+        magic, count, palette_size = _HEADER.unpack_from(view, 0)
+        if magic != _MAGIC:
+            raise ValueError("not a board document")
+        pos = _HEADER.size
+        for _ in range(palette_size):
+            size = view[pos]
+            doc._color(bytes(view[pos + 1: pos + 1 + size]).decode())
+            pos += 1 + size
+        for index in range(count):
+            kind, tool, color, width, bx0, by0, bx1, by1, npoints, text_len = _ELEMENT.unpack_from(view, pos)
+            pos += _ELEMENT.size
+            coords = array("f")
+            coords.frombytes(view[pos: pos + npoints * 8])
+            pos += npoints * 8
+            if text_len:
+                doc.texts[index] = bytes(view[pos: pos + text_len]).decode()
+                pos += text_len
+            doc.kinds.append(kind)
+            doc.tools.append(tool)
+            doc.colors.append(color)
+            doc.widths.append(width)
+            doc.bboxes.extend((bx0, by0, bx1, by1))
+            doc.offsets.append(len(doc.points))
+            doc.counts.append(npoints)
+            doc.points.extend(coords)
+            doc._index(index, (bx0, by0, bx1, by1))
+        doc.size = count
+        return doc
+
+    def render_tile(self, zoom: int, tx: int, ty: int, size: int = TILE_SIZE) -> Optional[bytes]:
+        """PNG of one map-style tile: at zoom z a tile covers ``size * 2**z`` canvas pixels.
+
+        Returns None when Pillow is not installed.
+        """
+        if Image is None:
+            return None
+        span = size * (2 ** zoom)
+        scale = size / span
+        ox, oy = tx * span, ty * span
+        img = Image.new("RGBA", (size, size), (255, 255, 255, 0))
+        draw = ImageDraw.Draw(img)
+
+        for index in self.query((ox, oy, ox + span, oy + span)):
+            el = self.element(index)
+            pts = [((x - ox) * scale, (y - oy) * scale) for x, y in zip(el["points"][0::2], el["points"][1::2])]
+            width = max(1, round(el["width"] * scale))
+            tool = el["tool"]
+            # erasing is approximated by painting white
+            color = "#ffffff" if tool == "eraser" else el["color"]
+            try:
+                if el["kind"] == "stroke":
+                    draw.line(pts, fill=color, width=width, joint="curve")
+                elif tool in ("rect", "ellipse"):
+                    (x0, y0), (x1, y1) = pts[0], pts[-1]
+                    box = [min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)]
+                    shape = draw.rectangle if tool == "rect" else draw.ellipse
+                    shape(box, outline=color, width=width)
+                elif tool in ("line", "arrow"):
+                    draw.line([pts[0], pts[-1]], fill=color, width=width)
+                    if tool == "arrow":
+                        (x0, y0), (x1, y1) = pts[0], pts[-1]
+                        angle = math.atan2(y1 - y0, x1 - x0)
+                        head = ARROW_HEAD * scale
+                        draw.polygon([
+                            (x1, y1),
+                            (x1 - head * math.cos(angle - math.pi / 6), y1 - head * math.sin(angle - math.pi / 6)),
+                            (x1 - head * math.cos(angle + math.pi / 6), y1 - head * math.sin(angle + math.pi / 6)),
+                        ], fill=color)
+                elif tool == "text" and el.get("text"):
+                    draw.text((pts[0][0], pts[0][1] - TEXT_HEIGHT * scale), el["text"], fill=color)
+            except ValueError:
+                # colors Pillow cannot parse are skipped rather than failing the tile
+                continue
+
+        out = io.BytesIO()
+        img.save(out, format="PNG", optimize=True)
+        return out.getvalue()
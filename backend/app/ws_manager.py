@@ -1,30 +1,228 @@
 
-from typing import Dict, List
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Set
 from fastapi import WebSocket
 import asyncio
+import json
+import os
+import socket
+
+from .broker import Broker, InMemoryBroker, broker_from_url
+
+# Ordered messages a client may have queued before it is considered stalled
+MAX_PENDING_PER_CLIENT = 512
+# A single websocket write taking longer than this evicts the client
+SEND_TIMEOUT = 5.0
+# Close code sent to evicted clients ("try again later")
+STALLED_CLOSE_CODE = 1013
+# Identifies this process in affinity metrics
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+class ClientOutbox:
+    """Outbound queue and writer task for one websocket.
+
+    Ordered messages (ops, sync, errors) are delivered in order; a client that
+    lets more than ``max_pending`` of them pile up is stalled and gets evicted.
+    Keyed messages (cursors) only keep the latest value per key, so a slow
+    client skips superseded positions instead of falling behind.
+    """
+
+    def __init__(self, websocket: WebSocket, on_evict, max_pending: int = MAX_PENDING_PER_CLIENT):
+        self.websocket = websocket
+        self.max_pending = max_pending
+        self.pending: Deque[str] = deque()
+        self.latest: "OrderedDict[str, str]" = OrderedDict()
+        self.closed = False
+        self._on_evict = on_evict
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._writer())
+
+    def push(self, text: str, key: Optional[str] = None) -> bool:
+        if self.closed:
+            return False
+        if key is not None:
+            self.latest.pop(key, None)
+            self.latest[key] = text
+        elif len(self.pending) >= self.max_pending:
+            return False
+        else:
+            self.pending.append(text)
+        self._wakeup.set()
+        return True
+
+    def _drain(self) -> List[str]:
+        batch = list(self.pending)
+        self.pending.clear()
+        batch.extend(self.latest.values())
+        self.latest.clear()
+        return batch
+
+    async def _writer(self):
+        try:
+            while not self.closed:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                batch = self._drain()
+                if not batch:
+                    continue
+                # messages are already serialized, so batching is a string join
+                if len(batch) == 1:
+                    frame = batch[0]
+                else:
+                    frame = '{"type":"batch","messages":[' + ",".join(batch) + "]}"
+                await asyncio.wait_for(self.websocket.send_text(frame), SEND_TIMEOUT)
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            # timed out or the socket died under us
+            self._on_evict(self)
+
+    def close(self):
+        self.closed = True
+        if self._task is not asyncio.current_task():
+            self._task.cancel()
+
+class RoomStats:
+    __slots__ = ("published", "delivered")
 
-class ConnectionManager:
     def __init__(self):
-        self.active_connections: Dict[str, List[WebSocket]] = {}
+        self.published = 0
+        self.delivered = 0
+
+class ConnectionManager:
+    """Local websockets for this worker, joined to other workers via a broker."""
+
+    def __init__(self, broker: Optional[Broker] = None):
+        self.broker = broker or InMemoryBroker()
+        self.active_connections: Dict[str, Set[WebSocket]] = {}
+        self.outboxes: Dict[WebSocket, ClientOutbox] = {}
+        self.client_rooms: Dict[WebSocket, str] = {}
+        self.stats: Dict[str, RoomStats] = {}
+        self.evicted = 0
+        self._started: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self._started is None:
+            self._started = asyncio.ensure_future(self.broker.start(self._deliver))
+        await self._started
+
+    async def close(self):
+        if self._started is not None:
+            await self.broker.close()
+            self._started = None
 
     async def connect(self, room: str, websocket: WebSocket):
+        await self.start()
         await websocket.accept()
-        self.active_connections.setdefault(room, []).append(websocket)
+        connections = self.active_connections.setdefault(room, set())
+        first = not connections
+        connections.add(websocket)
+        self.outboxes[websocket] = ClientOutbox(websocket, self._evict)
+        self.client_rooms[websocket] = room
+        if first:
+            await self.broker.subscribe(room)
+        await self.broker.set_affinity(room, WORKER_ID, len(connections))
 
     def disconnect(self, room: str, websocket: WebSocket):
-        if room in self.active_connections:
-            self.active_connections[room] = [w for w in self.active_connections[room] if w != websocket]
+        self.client_rooms.pop(websocket, None)
+        outbox = self.outboxes.pop(websocket, None)
+        if outbox is not None:
+            outbox.close()
+        connections = self.active_connections.get(room)
+        if connections is None or websocket not in connections:
+            return
+        connections.discard(websocket)
+        if not connections:
+            del self.active_connections[room]
+            self.stats.pop(room, None)
+        asyncio.ensure_future(self._release(room))
+
+    async def _release(self, room: str):
+        # re-read: someone may have joined the room since the disconnect was scheduled
+        remaining = len(self.active_connections.get(room, ()))
+        try:
+            if not remaining:
+                await self.broker.unsubscribe(room)
+            await self.broker.set_affinity(room, WORKER_ID, remaining)
+        except Exception:
+            pass
 
-    async def broadcast(self, room: str, message: dict):
-        if room not in self.active_connections:
+    def _evict(self, outbox: ClientOutbox):
+        websocket = outbox.websocket
+        room = self.client_rooms.get(websocket)
+        if room is None:
             return
-        coros = []
-        for connection in list(self.active_connections[room]):
-            try:
-                coros.append(connection.send_json(message))
-            except Exception:
-                pass
-        if coros:
-            await asyncio.gather(*coros, return_exceptions=True)
-
-manager = ConnectionManager()
+        self.evicted += 1
+        self.disconnect(room, websocket)
+        asyncio.ensure_future(self._close_quietly(websocket))
+
+    @staticmethod
+    async def _close_quietly(websocket: WebSocket):
+        try:
+            await websocket.close(code=STALLED_CLOSE_CODE)
+        except Exception:
+            pass
+
+    async def publish_op(self, room: str, op: dict, client: str = "") -> dict:
+        """Sequence, log and fan out a drawing op to the room on every worker."""
+        self.stats.setdefault(room, RoomStats()).published += 1
+        return await self.broker.publish_op(room, op, client)
+
+    async def ops_since(self, room: str, seq: int) -> List[dict]:
+        return await self.broker.ops_since(room, seq)
+
+    async def current_seq(self, room: str) -> int:
+        return await self.broker.current_seq(room)
+
+    async def epoch(self, room: str) -> str:
+        return await self.broker.epoch(room)
+
+    @staticmethod
+    def encode(message: dict) -> str:
+        return json.dumps(message, separators=(",", ":"))
+
+    async def send(self, websocket: WebSocket, message: dict):
+        """Queue a message for one client, behind anything already queued."""
+        outbox = self.outboxes.get(websocket)
+        if outbox is not None and not outbox.push(self.encode(message)):
+            self._evict(outbox)
+
+    async def broadcast(self, room: str, message: dict, key: Optional[str] = None):
+        """Publish a message to a room on every worker.
+
+        The message is serialized once here; each worker then queues the same
+        text on its local connections. Pass a ``key`` for messages where only
+        the newest value matters (e.g. cursors).
+        """
+        self.stats.setdefault(room, RoomStats()).published += 1
+        await self.broker.publish(room, self.encode(message), key)
+
+    def _deliver(self, room: str, key: Optional[str], text: str):
+        """Fan a serialized message out to this worker's connections in a room."""
+        connections = self.active_connections.get(room)
+        if not connections:
+            return
+        self.stats.setdefault(room, RoomStats()).delivered += 1
+        stalled = []
+        for websocket in connections:
+            outbox = self.outboxes.get(websocket)
+            if outbox is not None and not outbox.push(text, key):
+                stalled.append(outbox)
+        for outbox in stalled:
+            self._evict(outbox)
+
+    def local_stats(self) -> dict:
+        return {
+            "worker": WORKER_ID,
+            "evicted": self.evicted,
+            "rooms": {
+                room: {
+                    "connections": len(connections),
+                    "published": self.stats.get(room, RoomStats()).published,
+                    "delivered": self.stats.get(room, RoomStats()).delivered,
+                }
+                for room, connections in self.active_connections.items()
+            },
+        }
+
+manager = ConnectionManager(broker_from_url(os.getenv("BROKER_URL", "memory://")))
@@ -0,0 +1,34 @@
+import os
+import sys
+from contextlib import asynccontextmanager
+
+# make the ``app`` package importable when pytest runs from the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine  # noqa: E402
+
+from app.db import Base  # noqa: E402
+
+@asynccontextmanager
+async def memory_db():
+    """Session factory over a fresh in-memory SQLite database with all tables."""
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    try:
+        yield async_sessionmaker(engine, expire_on_commit=False)
+    finally:
+        await engine.dispose()
+
+def stroke(*points, **extra):
+    """A pen-stroke op through ``points`` (flat x, y pairs; a short line if omitted)."""
+    return {"kind": "stroke", "tool": "pen", "points": list(points or (0, 0, 1, 1)), **extra}
+
+class FakeClock:
+    """Stand-in for the ``time`` module in app.cache, advanced by hand."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
@@ -0,0 +1,220 @@
+"""Small asyncio stand-in for a Redis server, covering the commands RedisBroker uses.
+
+The broker's scripts are emulated in Python (there is no Lua here); any
+other script is rejected.
+"""
+import asyncio
+import hashlib
+from typing import Dict, List, Set
+
+from app.broker import _PUBLISH_OP, _TOUCH
+
+class FakeRedis:
+    def __init__(self):
+        self.strings: Dict[bytes, bytes] = {}
+        self.zsets: Dict[bytes, Dict[bytes, float]] = {}
+        self.hashes: Dict[bytes, Dict[bytes, bytes]] = {}
+        self.ttls: Dict[bytes, int] = {}
+        self.scripts: Dict[str, bytes] = {}
+        self.subscribers: Dict[bytes, Set[asyncio.StreamWriter]] = {}
+        self.writers: Set[asyncio.StreamWriter] = set()
+        self.server = None
+        self.port = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        self.drop_connections()
+        self.server.close()
+        await self.server.wait_closed()
+
+    def drop_connections(self):
+        """Simulate a server restart / network failure for every client."""
+        for writer in list(self.writers):
+            writer.close()
+        self.writers.clear()
+        self.subscribers.clear()
+
+    # -- protocol --------------------------------------------------------
+
+    @staticmethod
+    def _encode(value) -> bytes:
+        if value is None:
+            return b"$-1\r\n"
+        if isinstance(value, Exception):
+            return b"-%s\r\n" % str(value).encode()
+        if isinstance(value, str):
+            return b"+%s\r\n" % value.encode()
+        if isinstance(value, int):
+            return b":%d\r\n" % value
+        if isinstance(value, bytes):
+            return b"$%d\r\n%s\r\n" % (len(value), value)
+        return b"*%d\r\n" % len(value) + b"".join(FakeRedis._encode(v) for v in value)
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.writers.add(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                args: List[bytes] = []
+                for _ in range(int(line[1:-2])):
+                    size = int((await reader.readline())[1:-2])
+                    args.append((await reader.readexactly(size + 2))[:-2])
+                name = args[0].decode().upper()
+                if name in ("SUBSCRIBE", "UNSUBSCRIBE"):
+                    for channel in args[1:]:
+                        subs = self.subscribers.setdefault(channel, set())
+                        if name == "SUBSCRIBE":
+                            subs.add(writer)
+                        else:
+                            subs.discard(writer)
+                        writer.write(self._encode([name.lower().encode(), channel, len(subs)]))
+                else:
+                    try:
+                        reply = getattr(self, "cmd_" + name.lower())(*args[1:])
+                    except Exception as exc:
+                        reply = exc
+                    writer.write(self._encode(reply))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self.writers.discard(writer)
+            for subs in self.subscribers.values():
+                subs.discard(writer)
+
+    # -- commands --------------------------------------------------------
+
+    def cmd_get(self, key):
+        return self.strings.get(key)
+
+    def cmd_set(self, key, value, *opts):
+        opts = [o.upper() for o in opts]
+        if b"NX" in opts and key in self.strings:
+            return None
+        self.strings[key] = value
+        return "OK"
+
+    def cmd_incr(self, key):
+        value = int(self.strings.get(key, b"0")) + 1
+        self.strings[key] = str(value).encode()
+        return value
+
+    def cmd_del(self, *keys):
+        removed = 0
+        for key in keys:
+            for table in (self.strings, self.zsets, self.hashes):
+                if table.pop(key, None) is not None:
+                    removed += 1
+        return removed
+
+    def cmd_expire(self, key, seconds):
+        self.ttls[key] = int(seconds)
+        return 1
+
+    def cmd_zadd(self, key, score, member):
+        self.zsets.setdefault(key, {})[member] = float(score)
+        return 1
+
+    def _sorted(self, key):
+        return sorted(self.zsets.get(key, {}).items(), key=lambda kv: kv[1])
+
+    @staticmethod
+    def _bound(raw: bytes):
+        text = raw.decode()
+        exclusive = text.startswith("(")
+        text = text.lstrip("(")
+        value = float(text.replace("+inf", "inf"))
+        return value, exclusive
+
+    def _in_range(self, score, low, high):
+        (lo, lo_ex), (hi, hi_ex) = self._bound(low), self._bound(high)
+        return (score > lo if lo_ex else score >= lo) and (score < hi if hi_ex else score <= hi)
+
+    def cmd_zrangebyscore(self, key, low, high):
+        return [m for m, score in self._sorted(key) if self._in_range(score, low, high)]
+
+    def cmd_zremrangebyscore(self, key, low, high):
+        doomed = [m for m, score in self._sorted(key) if self._in_range(score, low, high)]
+        for member in doomed:
+            del self.zsets[key][member]
+        return len(doomed)
+
+    def cmd_zremrangebyrank(self, key, start, stop):
+        items = self._sorted(key)
+        start, stop = int(start), int(stop)
+        stop = len(items) + stop if stop < 0 else stop
+        doomed = items[max(start, 0): stop + 1]
+        for member, _ in doomed:
+            del self.zsets[key][member]
+        return len(doomed)
+
+    def cmd_hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[field] = value
+        return 1
+
+    def cmd_hget(self, key, field):
+        return self.hashes.get(key, {}).get(field)
+
+    def cmd_hincrby(self, key, field, amount):
+        table = self.hashes.setdefault(key, {})
+        value = int(table.get(field, b"0")) + int(amount)
+        table[field] = str(value).encode()
+        return value
+
+    def cmd_hdel(self, key, field):
+        return 1 if self.hashes.get(key, {}).pop(field, None) is not None else 0
+
+    def cmd_hgetall(self, key):
+        return [x for pair in self.hashes.get(key, {}).items() for x in pair]
+
+    def cmd_publish(self, channel, message):
+        subs = self.subscribers.get(channel, ())
+        for writer in subs:
+            writer.write(self._encode([b"message", channel, message]))
+        return len(subs)
+
+    def cmd_evalsha(self, sha, numkeys, *rest):
+        if sha.decode() not in self.scripts:
+            raise Exception("NOSCRIPT No matching script")
+        return self._run_script(self.scripts[sha.decode()], int(numkeys), rest)
+
+    def cmd_eval(self, script, numkeys, *rest):
+        self.scripts[hashlib.sha1(script).hexdigest()] = script
+        return self._run_script(script, int(numkeys), rest)
+
+    def _run_script(self, script, numkeys, rest):
+        keys, argv = rest[:numkeys], rest[numkeys:]
+        if script.decode() == _TOUCH:
+            for key in keys:
+                self.cmd_expire(key, argv[0])
+            return len(keys)
+        if script.decode() != _PUBLISH_OP:
+            raise Exception("ERR unknown script")
+        seq_key, log_key, epoch_key, points_key = keys
+        channel, client, op, is_clear, max_ops, ttl, epoch, points, max_points = argv
+        seq = self.cmd_incr(seq_key)
+        self.cmd_set(epoch_key, epoch, b"NX")
+        entry = b'{"type":"op","seq":%d,"client":%s,"op":%s}' % (seq, client, op)
+        if is_clear == b"1":
+            self.cmd_del(log_key, points_key)
+        self.cmd_zadd(log_key, seq, entry)
+        self.cmd_hset(points_key, str(seq).encode(), points)
+        total = self.cmd_hincrby(points_key, b"total", points)
+        count = len(self.zsets[log_key])
+        while count > 1 and (count > int(max_ops) or total > int(max_points)):
+            (_, head), = self._sorted(log_key)[:1]
+            head = str(int(head)).encode()
+            self.cmd_zremrangebyrank(log_key, b"0", b"0")
+            total = self.cmd_hincrby(points_key, b"total", -int(self.cmd_hget(points_key, head) or b"0"))
+            self.cmd_hdel(points_key, head)
+            count -= 1
+        self.cmd_publish(channel, b"\n" + entry)
+        for key in keys:
+            self.cmd_expire(key, ttl)
+        return entry
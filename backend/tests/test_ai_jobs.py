@@ -0,0 +1,102 @@
+import asyncio
+import io
+import threading
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+from fastapi import HTTPException
+
+from app import ai_jobs
+from app.ai_jobs import JobManager
+from app.blobstore import BlobStore
+
+class FakeUpload:
+    def __init__(self, data: bytes):
+        self.file = io.BytesIO(data)
+
+    async def read(self, size=-1):
+        return self.file.read(size)
+
+class BrokenExecutor(Executor):
+    """What a ProcessPoolExecutor does after one of its workers died."""
+
+    def __init__(self):
+        self.shut_down = False
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        future.set_exception(BrokenProcessPool("a child process terminated abruptly"))
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut_down = True
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    release = threading.Event()
+
+    def echo(data):
+        release.wait(5)
+        return "text/plain", data.upper()
+
+    monkeypatch.setattr(ai_jobs, "PROCESSORS", {"echo": echo})
+    monkeypatch.setattr(ai_jobs, "AI_UPLOAD_DIR", str(tmp_path / "uploads"))
+    manager = JobManager(store=BlobStore(str(tmp_path / "results")), max_pending=2)
+    # threads see the patched PROCESSORS; worker processes would not
+    manager._executor = ThreadPoolExecutor(max_workers=2)
+    manager.release = release
+    yield manager
+    release.set()
+    manager.shutdown()
+
+def test_identical_submissions_share_one_job(manager):
+    async def scenario():
+        first = await manager.submit("echo", FakeUpload(b"board"))
+        second = await manager.submit("echo", FakeUpload(b"board"))
+        manager.release.set()
+        await manager.wait(first, 5)
+        # finished results are served from the cache too
+        third = await manager.submit("echo", FakeUpload(b"board"))
+        return first, second, third
+
+    first, second, third = asyncio.run(scenario())
+    assert first is second is third
+    assert first.status == "done"
+    assert manager.store.get(first.result_digest) == b"BOARD"
+
+def test_submissions_past_the_pending_limit_get_503(manager):
+    async def scenario():
+        jobs = [await manager.submit("echo", FakeUpload(b"job %d" % i)) for i in range(2)]
+        with pytest.raises(HTTPException) as exc:
+            await manager.submit("echo", FakeUpload(b"one too many"))
+        manager.release.set()
+        for job in jobs:
+            await manager.wait(job, 5)
+        return exc.value.status_code
+
+    assert asyncio.run(scenario()) == 503
+
+def test_oversized_upload_gets_413_and_leaves_no_spool_file(manager, monkeypatch, tmp_path):
+    monkeypatch.setattr(ai_jobs, "AI_MAX_UPLOAD_BYTES", 10)
+    monkeypatch.setattr(ai_jobs, "UPLOAD_CHUNK_SIZE", 4)
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(manager.submit("echo", FakeUpload(b"x" * 11)))
+    assert exc.value.status_code == 413
+    assert list((tmp_path / "uploads").iterdir()) == []
+
+def test_broken_pool_is_replaced(manager):
+    manager._executor.shutdown()
+    broken = manager._executor = BrokenExecutor()
+
+    async def scenario():
+        job = await manager.submit("echo", FakeUpload(b"crash"))
+        await manager.wait(job, 5)
+        return job
+
+    job = asyncio.run(scenario())
+    assert job.status == "error"
+    assert broken.shut_down
+    assert manager._executor is None
+    assert not manager.in_flight
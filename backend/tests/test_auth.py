@@ -0,0 +1,63 @@
+import asyncio
+from datetime import timedelta
+
+from app import auth, cache, models
+from conftest import FakeClock, memory_db
+
+def setup_function():
+    auth._user_cache.clear()
+    auth._token_cache.clear()
+
+async def _add_user(sessions, username="alice"):
+    async with sessions() as db:
+        db.add(models.User(username=username, hashed_password="hash"))
+        await db.commit()
+
+def test_cached_user_survives_the_loading_session():
+    async def scenario():
+        async with memory_db() as sessions:
+            await _add_user(sessions)
+            async with sessions() as db:
+                first = await auth.get_user(db, "alice")
+                # e.g. BoardStore.append's retry / failure paths
+                await db.rollback()
+                db.expire_all()
+            async with sessions() as db:
+                second = await auth.get_user(db, "alice")
+            return first, second
+
+    first, second = asyncio.run(scenario())
+    assert second is first
+    assert isinstance(second, auth.Principal)
+    assert (second.username, second.hashed_password) == ("alice", "hash")
+
+def test_user_cache_expires_and_invalidates(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache, "time", clock)
+
+    async def scenario():
+        async with memory_db() as sessions:
+            await _add_user(sessions)
+            async with sessions() as db:
+                await auth.get_user(db, "alice")
+                assert "alice" in auth._user_cache
+                clock.now += auth.USER_CACHE_TTL + 1
+                assert "alice" not in auth._user_cache
+
+                await auth.get_user(db, "alice")
+                auth.invalidate_user("alice")
+                assert "alice" not in auth._user_cache
+                assert await auth.get_user(db, "nobody") is None
+                # misses are not cached
+                assert "nobody" not in auth._user_cache
+
+    asyncio.run(scenario())
+
+def test_token_cache_never_outlives_the_token(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache, "time", clock)
+    token = auth.create_access_token({"sub": "alice"}, timedelta(seconds=30))
+    assert auth.decode_token(token)["sub"] == "alice"
+    assert token in auth._token_cache
+    clock.now += 31
+    assert token not in auth._token_cache
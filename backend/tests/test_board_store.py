@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app import models
+from app.auth import Principal
+from app.board_store import BoardStore
+from conftest import memory_db, stroke
+
+def run(scenario):
+    async def main():
+        async with memory_db() as sessions, sessions() as db:
+            board = models.Board(owner="u", title="t", element_count=0, version=0, snapshot_seq=0)
+            db.add(board)
+            await db.commit()
+            return await scenario(BoardStore(snapshot_ops=3), db, board.id)
+    return asyncio.run(main())
+
+def test_append_never_mutates_a_document_readers_hold():
+    async def scenario(store, db, board_id):
+        await store.append(db, board_id, "u", [stroke(0, 0)])
+        held = await store.load(db, await store.get_owned(db, board_id, "u"))
+        # past the snapshot threshold, so this also compacts
+        version, ids = await store.append(db, board_id, "u", [stroke(10, 10), stroke(20, 20), stroke(30, 30)])
+        current = await store.load(db, await store.get_owned(db, board_id, "u"))
+        return held, version, ids, current
+
+    held, version, ids, current = run(scenario)
+    assert len(held) == 1
+    assert (version, ids) == (4, [1, 2, 3])
+    assert len(current) == 4
+
+def test_bad_op_rejects_the_whole_batch():
+    async def scenario(store, db, board_id):
+        await store.append(db, board_id, "u", [stroke(0, 0)])
+        with pytest.raises(HTTPException) as exc:
+            await store.append(db, board_id, "u", [stroke(10, 10), {"kind": "stroke", "points": [0, float("nan")]}])
+        board = await store.get_owned(db, board_id, "u")
+        version, size = board.version, len(await store.load(db, board))
+        # the rejected batch left storage behind the cached document; the next save must not see it
+        _, ids = await store.append(db, board_id, "u", [stroke(20, 20)])
+        return exc.value.status_code, version, size, ids
+
+    assert run(scenario) == (400, 1, 1, [1])
+
+def test_failed_commit_drops_the_cached_document():
+    async def scenario(store, db, board_id):
+        await store.append(db, board_id, "u", [stroke(0, 0)])
+        held = store.documents.get(board_id)[1]
+
+        async def broken_commit():
+            raise RuntimeError("disk full")
+
+        commit, db.commit = db.commit, broken_commit
+        with pytest.raises(RuntimeError):
+            await store.append(db, board_id, "u", [stroke(10, 10)])
+        db.commit = commit
+        evicted = store.documents.get(board_id) is None
+        board = await store.get_owned(db, board_id, "u")
+        return held, evicted, board.version, len(await store.load(db, board))
+
+    held, evicted, version, size = run(scenario)
+    assert len(held) == 1
+    assert evicted
+    assert (version, size) == (1, 1)
+
+def test_tiles_outside_the_coordinate_range_are_rejected():
+    from app.routers.boards import board_tile
+
+    async def scenario(store, db, board_id):
+        with pytest.raises(HTTPException) as exc:
+            await board_tile(board_id, 0, 10 ** 400, 0, None, db, Principal(1, "u", ""))
+        return exc.value.status_code
+
+    assert run(scenario) == 400
@@ -0,0 +1,204 @@
+import asyncio
+import json
+
+from app.broker import InMemoryBroker, RedisBroker, RoomLog
+from conftest import stroke
+from fake_redis import FakeRedis
+
+def test_room_log_since_and_clear():
+    log = RoomLog()
+    for _ in range(5):
+        log.append(stroke(), "a")
+    assert [e["seq"] for e in log.since(0)] == [1, 2, 3, 4, 5]
+    assert [e["seq"] for e in log.since(3)] == [4, 5]
+    assert log.since(5) == []
+    log.clear()
+    entry = log.append({"kind": "clear"})
+    # seqs keep counting across a clear
+    assert entry["seq"] == 6
+    assert [e["seq"] for e in log.since(0)] == [6]
+
+def test_room_log_bounded_by_ops_and_points():
+    log = RoomLog(maxlen=3)
+    for _ in range(5):
+        log.append(stroke())
+    assert [e["seq"] for e in log.since(0)] == [3, 4, 5]
+
+    log = RoomLog(max_points=10)
+    for _ in range(4):
+        log.append(stroke(*range(8)))
+    assert log.points <= 10
+    assert [e["seq"] for e in log.since(0)] == [3, 4]
+    # a single op bigger than the budget is still kept
+    log.append(stroke(*range(100)))
+    assert [e["seq"] for e in log.since(0)] == [5]
+
+def test_in_memory_broker_publishes_in_seq_order():
+    delivered = []
+
+    async def scenario():
+        broker = InMemoryBroker()
+        await broker.start(lambda room, key, text: delivered.append((room, json.loads(text))))
+        await broker.subscribe("r")
+        for _ in range(3):
+            await broker.publish_op("r", stroke(), "c")
+        await broker.publish_op("other", stroke(), "c")  # nobody subscribed here
+        await broker.publish_op("r", {"kind": "clear"}, "c")
+        return broker
+
+    broker = asyncio.run(scenario())
+    assert [(room, msg["seq"]) for room, msg in delivered] == [("r", 1), ("r", 2), ("r", 3), ("r", 4)]
+    assert [e["seq"] for e in asyncio.run(broker.ops_since("r", 0))] == [4]
+    assert asyncio.run(broker.current_seq("r")) == 4
+
+def test_in_memory_broker_expires_idle_rooms():
+    async def scenario():
+        broker = InMemoryBroker(idle_ttl=-1)
+        await broker.subscribe("live")
+        await broker.publish_op("live", stroke())
+        await broker.publish_op("idle", stroke())
+        old_epoch = await broker.epoch("idle")
+        broker.expire_idle()
+        return broker, old_epoch
+
+    broker, old_epoch = asyncio.run(scenario())
+    assert set(broker.rooms) == {"live"}
+    # a recreated log starts a new epoch
+    assert asyncio.run(broker.epoch("idle")) != old_epoch
+
+async def _wait_for(predicate, timeout=2.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not predicate():
+        assert loop.time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+def test_redis_broker_orders_ops_across_workers():
+    async def scenario():
+        server = await FakeRedis().start()
+        seen = {"a": [], "b": []}
+        a, b = RedisBroker(port=server.port), RedisBroker(port=server.port)
+        await a.start(lambda room, key, text: seen["a"].append(json.loads(text)))
+        await b.start(lambda room, key, text: seen["b"].append(json.loads(text)))
+        await a.subscribe("r")
+        await b.subscribe("r")
+        await _wait_for(lambda: len(server.subscribers.get(b"board:room:r", ())) == 2)
+
+        await asyncio.gather(*(
+            (a if i % 2 else b).publish_op("r", stroke(), f"c{i}") for i in range(10)
+        ))
+        await _wait_for(lambda: len(seen["a"]) == 10 and len(seen["b"]) == 10)
+        logged = await a.ops_since("r", 4)
+        current = await b.current_seq("r")
+        await a.publish_op("r", {"kind": "clear"})
+        after_clear = await b.ops_since("r", 0)
+        await a.close()
+        await b.close()
+        await server.stop()
+        return seen, logged, current, after_clear
+
+    seen, logged, current, after_clear = asyncio.run(scenario())
+    assert [m["seq"] for m in seen["a"]][:10] == list(range(1, 11))
+    assert seen["a"][:10] == seen["b"][:10]
+    assert [m["seq"] for m in logged] == list(range(5, 11))
+    assert current == 10
+    assert [m["seq"] for m in after_clear] == [11]
+
+def test_redis_broker_reconnects_and_resubscribes():
+    async def scenario():
+        server = await FakeRedis().start()
+        seen = []
+        broker = RedisBroker(port=server.port)
+        await broker.start(lambda room, key, text: seen.append(json.loads(text)))
+        await broker.subscribe("r")
+        await _wait_for(lambda: server.subscribers.get(b"board:room:r"))
+
+        server.drop_connections()
+        # the command connection is re-dialled transparently
+        await broker.publish_op("r", stroke())
+        await _wait_for(lambda: server.subscribers.get(b"board:room:r"))
+        await broker.publish_op("r", stroke())
+        await _wait_for(lambda: seen)
+        await broker.close()
+        await server.stop()
+        return seen
+
+    seen = asyncio.run(scenario())
+    assert [m["seq"] for m in seen] == [2]
+
+def test_redis_broker_epoch_changes_when_seq_restarts():
+    async def scenario():
+        server = await FakeRedis().start()
+        broker = RedisBroker(port=server.port)
+        await broker.start(lambda *args: None)
+        await broker.publish_op("r", stroke())
+        first = await broker.epoch("r")
+        assert await broker.epoch("r") == first
+        # the keys expired
+        server.strings.clear()
+        server.zsets.clear()
+        await broker.publish_op("r", stroke())
+        second = await broker.epoch("r")
+        await broker.close()
+        await server.stop()
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first != second
+
+def test_redis_broker_keeps_the_epoch_a_joiner_saw():
+    async def scenario():
+        server = await FakeRedis().start()
+        broker = RedisBroker(port=server.port)
+        await broker.start(lambda *args: None)
+        # a client joins the empty room first, then the room's first op arrives
+        seen_on_join = await broker.epoch("r")
+        await broker.publish_op("r", stroke())
+        after_op = await broker.epoch("r")
+        await broker.close()
+        await server.stop()
+        return seen_on_join, after_op
+
+    seen_on_join, after_op = asyncio.run(scenario())
+    assert seen_on_join == after_op
+
+def test_redis_broker_caps_log_points():
+    async def scenario():
+        server = await FakeRedis().start()
+        broker = RedisBroker(port=server.port, max_points=10)
+        await broker.start(lambda *args: None)
+        for _ in range(4):
+            await broker.publish_op("r", stroke(*range(8)))
+        capped = await broker.ops_since("r", 0)
+        total = server.hashes[b"board:pts:r"][b"total"]
+        await broker.publish_op("r", {"kind": "clear"})
+        await broker.publish_op("r", stroke())
+        after_clear = await broker.ops_since("r", 0)
+        total_after_clear = server.hashes[b"board:pts:r"][b"total"]
+        await broker.close()
+        await server.stop()
+        return capped, total, after_clear, total_after_clear
+
+    capped, total, after_clear, total_after_clear = asyncio.run(scenario())
+    assert [m["seq"] for m in capped] == [3, 4]
+    assert total == b"8"
+    assert [m["seq"] for m in after_clear] == [5, 6]
+    assert total_after_clear == b"2"
+
+def test_redis_broker_touch_refreshes_served_rooms():
+    async def scenario():
+        server = await FakeRedis().start()
+        broker = RedisBroker(port=server.port, idle_ttl=120)
+        await broker.start(lambda *args: None)
+        await broker.subscribe("r")
+        await broker.publish_op("r", stroke())
+        for key in list(server.ttls):
+            server.ttls[key] = 1
+        await broker.touch(*broker.rooms)
+        await broker.close()
+        await server.stop()
+        return server.ttls
+
+    ttls = asyncio.run(scenario())
+    for kind in ("seq", "ops", "epoch", "pts"):
+        assert ttls[f"board:{kind}:r".encode()] == 120
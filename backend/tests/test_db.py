@@ -0,0 +1,28 @@
+import pytest
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.db import _engine_options, normalize_url
+
+@pytest.mark.parametrize("url, expected", [
+    ("sqlite:///./whiteboard.db", "sqlite+aiosqlite:///./whiteboard.db"),
+    ("sqlite+aiosqlite:///./whiteboard.db", "sqlite+aiosqlite:///./whiteboard.db"),
+    ("postgres://u:p@db:5432/wb", "postgresql+asyncpg://u:p@db:5432/wb"),
+    ("postgresql://u:p@db/wb", "postgresql+asyncpg://u:p@db/wb"),
+    ("postgresql+asyncpg://u:p@db/wb", "postgresql+asyncpg://u:p@db/wb"),
+])
+def test_normalize_url_maps_to_async_drivers(url, expected):
+    assert normalize_url(url) == expected
+
+def test_file_sqlite_gets_a_real_pool():
+    options = _engine_options(make_url("sqlite+aiosqlite:///./whiteboard.db"))
+    assert options["poolclass"] is AsyncAdaptedQueuePool
+    assert "timeout" in options["connect_args"]
+
+def test_memory_sqlite_keeps_the_dialect_pool():
+    assert "poolclass" not in _engine_options(make_url("sqlite+aiosqlite://"))
+
+def test_postgres_pool_is_recycled_and_pinged():
+    options = _engine_options(make_url("postgresql+asyncpg://u:p@db/wb"))
+    assert options["pool_pre_ping"] and options["pool_recycle"] > 0
+    assert "prepared_statement_cache_size" in options["connect_args"]
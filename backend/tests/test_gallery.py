@@ -0,0 +1,181 @@
+import asyncio
+import base64
+import io
+import os
+from datetime import datetime
+
+import pytest
+from PIL import Image
+from sqlalchemy import insert
+
+from app import models
+from app.auth import Principal
+from app.blobstore import BlobStore
+from app.routers import gallery
+from conftest import memory_db
+
+ALICE = Principal(id=1, username="alice", hashed_password="x")
+
+def png(shade: int = 0) -> bytes:
+    out = io.BytesIO()
+    Image.new("RGB", (64, 48), (shade, 0, 0)).save(out, "PNG")
+    return out.getvalue()
+
+def data_url(raw: bytes) -> str:
+    return "data:image/png;base64," + base64.b64encode(raw).decode()
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = BlobStore(str(tmp_path / "blobs"))
+    monkeypatch.setattr(gallery, "blob_store", store)
+    return store
+
+async def save(sessions, raw: bytes, title="d", user=ALICE):
+    async with sessions() as db:
+        return await gallery.save_diagram(gallery.DiagramIn(title=title, data=data_url(raw)), db, user)
+
+async def delete(sessions, diagram_id: int, user=ALICE):
+    async with sessions() as db:
+        return await gallery.delete_diagram(diagram_id, db, user)
+
+async def body(response) -> bytes:
+    return b"".join([chunk async for chunk in response.body_iterator])
+
+def blob_files(store):
+    return sorted(name for _, _, names in os.walk(store.root) for name in names)
+
+def test_blob_store_dedups_by_content(store):
+    first = store.put(b"same bytes")
+    assert store.put(b"same bytes") == first
+    assert blob_files(store) == [first]
+    assert store.get(first) == b"same bytes"
+    store.delete(first)
+    store.delete(first)  # already gone is fine
+    assert not store.exists(first)
+
+def test_shared_blobs_go_with_the_last_diagram(store):
+    async def scenario():
+        async with memory_db() as sessions:
+            a = await save(sessions, png())
+            b = await save(sessions, png())
+            files = blob_files(store)
+            await delete(sessions, a.id)
+            after_first = blob_files(store)
+            await delete(sessions, b.id)
+            return files, after_first, blob_files(store)
+
+    files, after_first, after_last = asyncio.run(scenario())
+    # one image and one thumbnail, stored once for both diagrams
+    assert len(files) == 2
+    assert after_first == files
+    assert after_last == []
+
+def test_image_supports_ranges_and_etags(store):
+    raw = png(7)
+
+    async def scenario():
+        async with memory_db() as sessions:
+            diag = await save(sessions, raw)
+            async with sessions() as db:
+                full = await gallery.get_diagram_image(diag.id, None, None, db, ALICE)
+                full_body = await body(full)
+                part = await gallery.get_diagram_image(diag.id, "bytes=0-9", None, db, ALICE)
+                part_body = await body(part)
+                tail = await gallery.get_diagram_image(diag.id, "bytes=-4", None, db, ALICE)
+                tail_body = await body(tail)
+                bad = await gallery.get_diagram_image(diag.id, f"bytes={len(raw)}-", None, db, ALICE)
+                etag = full.headers["etag"]
+                cached = await gallery.get_diagram_image(diag.id, None, etag, db, ALICE)
+            return full, full_body, part, part_body, tail_body, bad, cached
+
+    full, full_body, part, part_body, tail_body, bad, cached = asyncio.run(scenario())
+    assert full_body == raw
+    assert full.headers["content-length"] == str(len(raw))
+    assert part.status_code == 206
+    assert part_body == raw[:10]
+    assert part.headers["content-range"] == f"bytes 0-9/{len(raw)}"
+    assert tail_body == raw[-4:]
+    assert bad.status_code == 416
+    assert cached.status_code == 304
+
+def test_delete_waits_for_an_in_flight_save_of_the_same_image(store, monkeypatch):
+    raw = png(3)
+    make_thumbnail = gallery.create_thumbnail
+
+    async def scenario():
+        async with memory_db() as sessions:
+            first = await save(sessions, raw)
+            entered, release = asyncio.Event(), asyncio.Event()
+
+            async def slow_thumbnail(data, blob_store):
+                # the second save has put the image but not committed its row yet
+                entered.set()
+                await release.wait()
+                return await make_thumbnail(data, blob_store)
+
+            monkeypatch.setattr(gallery, "create_thumbnail", slow_thumbnail)
+            saving = asyncio.create_task(save(sessions, raw))
+            await entered.wait()
+            deleting = asyncio.create_task(delete(sessions, first.id))
+            # long enough for an unguarded delete to commit and unlink
+            await asyncio.sleep(0.3)
+            during = blob_files(store)
+            release.set()
+            second = await saving
+            await deleting
+            async with sessions() as db:
+                served = await body(await gallery.get_diagram_image(second.id, None, None, db, ALICE))
+            return during, served, blob_files(store)
+
+    during, served, after = asyncio.run(scenario())
+    assert len(during) == 2
+    assert served == raw
+    assert len(after) == 2
+
+async def _add_rows(sessions, count: int, owner="alice", **values):
+    """Insert ``count`` diagrams in one statement, so they share one CURRENT_TIMESTAMP."""
+    async with sessions() as db:
+        await db.execute(insert(models.Diagram), [{"owner": owner, "title": str(i), **values} for i in range(count)])
+        await db.commit()
+
+async def _page(sessions, cursor=None, limit=2, user=ALICE):
+    async with sessions() as db:
+        page = await gallery.list_diagrams(cursor, limit, db, user)
+    return [item.id for item in page.items], page.next_cursor
+
+def test_paging_walks_rows_with_equal_timestamps():
+    async def scenario():
+        async with memory_db() as sessions:
+            await _add_rows(sessions, 5)
+            pages, cursor = [], None
+            while True:
+                ids, cursor = await _page(sessions, cursor)
+                pages.append(ids)
+                if cursor is None:
+                    return pages
+
+    assert asyncio.run(scenario()) == [[5, 4], [3, 2], [1]]
+
+def test_paging_continues_after_the_cursor_row_is_deleted(store):
+    async def scenario():
+        async with memory_db() as sessions:
+            await _add_rows(sessions, 5)
+            first, cursor = await _page(sessions)
+            await delete(sessions, first[-1])
+            second, _ = await _page(sessions, cursor)
+            return first, second
+
+    # the fallback compares the cursor's timestamp in SQLite's own text format
+    assert asyncio.run(scenario()) == ([5, 4], [3, 2])
+
+def test_cursor_cannot_anchor_on_another_users_row():
+    async def scenario():
+        async with memory_db() as sessions:
+            await _add_rows(sessions, 1, owner="mallory", created_at=datetime(2000, 1, 1))
+            await _add_rows(sessions, 3)
+            # claims a far-future timestamp but points at mallory's old row (id 1)
+            forged = gallery._encode_cursor(datetime(2100, 1, 1), 1)
+            return await _page(sessions, forged, limit=5)
+
+    ids, _ = asyncio.run(scenario())
+    assert ids == [4, 3, 2]
@@ -0,0 +1,71 @@
+import math
+
+import pytest
+
+from app import vector
+from app.vector import BoardDocument
+from conftest import stroke
+
+def test_add_indexes_and_queries():
+    doc = BoardDocument()
+    assert doc.add(stroke(0, 0, 10, 10)) == 0
+    assert doc.add(stroke(1000, 1000, 1010, 1010, color="#ff0000")) == 1
+    assert doc.query((-5, -5, 20, 20)) == [0]
+    assert doc.element(1)["color"] == "#ff0000"
+    restored = BoardDocument.from_bytes(doc.to_bytes())
+    assert [restored.element(i) for i in range(2)] == [doc.element(i) for i in range(2)]
+
+@pytest.mark.parametrize("op", [
+    stroke(0, math.nan),
+    stroke(0, math.inf),
+    stroke(0, 0, width=math.nan),
+    stroke(0, 0, width=-1),
+    {"kind": "shape", "tool": "polygon", "points": [0, 0, 1, 1]},
+])
+def test_add_rejects_bad_ops_without_partial_writes(op):
+    doc = BoardDocument()
+    doc.add(stroke(0, 0, 1, 1))
+    before = doc.to_bytes()
+    with pytest.raises(ValueError):
+        doc.add(op)
+    assert len(doc) == 1
+    assert doc.to_bytes() == before
+    assert doc.grid == BoardDocument.from_bytes(before).grid
+
+def test_palette_is_capped(monkeypatch):
+    monkeypatch.setattr(vector, "MAX_COLORS", 2)
+    doc = BoardDocument()
+    doc.add(stroke(0, 0, color="#000001"))
+    doc.add(stroke(0, 0, color="#000002"))
+    with pytest.raises(ValueError):
+        doc.add(stroke(0, 0, color="#000003"))
+    # known colours still work once the palette is full
+    assert doc.add(stroke(0, 0, color="#000001")) == 2
+    assert len(doc) == 3
+
+def test_fork_appends_without_changing_the_original():
+    doc = BoardDocument()
+    doc.add(stroke(0, 0, 1, 1))
+    doc.add(stroke(300, 300, 301, 301, color="#00ff00"))
+    before = doc.to_bytes()
+
+    fork = doc.fork()
+    # shares storage rather than copying it
+    assert fork.points is doc.points
+    fork.add(stroke(2, 2, 3, 3, color="#0000ff"))
+    assert len(fork) == 3 and len(doc) == 2
+    assert doc.query((-10, -10, 10, 10)) == [0]
+    assert doc.extent() == BoardDocument.from_bytes(before).extent()
+    assert [doc.element(i) for i in range(2)] == [BoardDocument.from_bytes(before).element(i) for i in range(2)]
+    # the original is no longer at the end of its storage
+    with pytest.raises(RuntimeError):
+        doc.add(stroke(5, 5))
+    again = doc.fork()
+    assert again.points is not doc.points
+    assert again.add(stroke(4, 4, 5, 5)) == 2
+    assert again.query((-10, -10, 10, 10)) == [0, 2]
+
+    # a clear on a fork swaps in new storage
+    cleared = fork.fork()
+    cleared.add({"kind": "clear"})
+    assert len(cleared) == 0 and len(fork) == 3
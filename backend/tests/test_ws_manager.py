@@ -0,0 +1,134 @@
+import asyncio
+import json
+
+from app import ws_manager
+from app.broker import InMemoryBroker
+from app.ws_manager import ClientOutbox, ConnectionManager, STALLED_CLOSE_CODE
+
+class FakeWebSocket:
+    """Records frames; ``gate`` can hold sends to simulate a slow client."""
+
+    def __init__(self):
+        self.frames = []
+        self.gate = asyncio.Event()
+        self.gate.set()
+        self.closed_with = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        await self.gate.wait()
+        self.frames.append(json.loads(text))
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+def messages(ws):
+    out = []
+    for frame in ws.frames:
+        out.extend(frame["messages"] if frame.get("type") == "batch" else [frame])
+    return out
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+def test_outbox_batches_in_order():
+    async def scenario():
+        ws = FakeWebSocket()
+        outbox = ClientOutbox(ws, on_evict=lambda o: None)
+        for i in range(3):
+            outbox.push(json.dumps({"type": "op", "seq": i}))
+        await settle()
+        outbox.close()
+        return ws
+
+    ws = asyncio.run(scenario())
+    assert len(ws.frames) == 1
+    assert [m["seq"] for m in messages(ws)] == [0, 1, 2]
+
+def test_outbox_coalesces_keyed_messages():
+    async def scenario():
+        ws = FakeWebSocket()
+        ws.gate.clear()
+        outbox = ClientOutbox(ws, on_evict=lambda o: None)
+        outbox.push(json.dumps({"type": "op", "seq": 1}))
+        await settle()  # the writer is now stuck sending the op
+        for x in range(10):
+            outbox.push(json.dumps({"type": "cursor", "x": x}), key="cursor:a")
+        outbox.push(json.dumps({"type": "cursor", "x": 99}), key="cursor:b")
+        ws.gate.set()
+        await settle()
+        outbox.close()
+        return ws
+
+    ws = asyncio.run(scenario())
+    cursors = [m for m in messages(ws) if m["type"] == "cursor"]
+    assert cursors == [{"type": "cursor", "x": 9}, {"type": "cursor", "x": 99}]
+
+def test_outbox_refuses_ordered_messages_past_limit():
+    async def scenario():
+        ws = FakeWebSocket()
+        ws.gate.clear()
+        outbox = ClientOutbox(ws, on_evict=lambda o: None, max_pending=2)
+        outbox.push("{}")
+        await settle()
+        accepted = [outbox.push("{}") for _ in range(3)]
+        # keyed messages never count against the limit
+        accepted.append(outbox.push("{}", key="cursor:a"))
+        outbox.close()
+        return accepted
+
+    assert asyncio.run(scenario()) == [True, True, False, True]
+
+def test_outbox_evicts_on_send_timeout(monkeypatch):
+    monkeypatch.setattr(ws_manager, "SEND_TIMEOUT", 0.01)
+    evicted = []
+
+    async def scenario():
+        ws = FakeWebSocket()
+        ws.gate.clear()
+        outbox = ClientOutbox(ws, on_evict=evicted.append)
+        outbox.push("{}")
+        await asyncio.sleep(0.05)
+        return outbox
+
+    outbox = asyncio.run(scenario())
+    assert evicted == [outbox]
+
+def test_manager_evicts_stalled_client_only():
+    async def scenario():
+        manager = ConnectionManager(InMemoryBroker())
+        slow, fast = FakeWebSocket(), FakeWebSocket()
+        await manager.connect("room", slow)
+        await manager.connect("room", fast)
+        manager.outboxes[slow].max_pending = 3
+        slow.gate.clear()
+        for seq in range(10):
+            await manager.broadcast("room", {"type": "op", "seq": seq})
+            await settle()
+        await settle()
+        return manager, slow, fast
+
+    manager, slow, fast = asyncio.run(scenario())
+    assert manager.evicted == 1
+    assert slow.closed_with == STALLED_CLOSE_CODE
+    assert manager.active_connections["room"] == {fast}
+    assert [m["seq"] for m in messages(fast)] == list(range(10))
+
+def test_rejoin_before_release_keeps_subscription():
+    async def scenario():
+        broker = InMemoryBroker()
+        manager = ConnectionManager(broker)
+        first, second = FakeWebSocket(), FakeWebSocket()
+        await manager.connect("room", first)
+        manager.disconnect("room", first)
+        # joins before the scheduled release has run
+        await manager.connect("room", second)
+        await settle()
+        return broker
+
+    broker = asyncio.run(scenario())
+    assert "room" in broker.subscribed
+    assert broker.workers["room"] == {ws_manager.WORKER_ID: 1}
@@ -13,12 +13,21 @@ export function login(username, password) {
 
 // Gallery/diagrams
 export function saveDiagram(payload, token) {
-  // payload = { title, data_json } (data_json should be stringified JSON if needed)
+  // payload = { title, data } where data is a base64 image data URL
   const headers = token ? { Authorization: `Bearer ${token}` } : {};
   return api.post("/api/gallery", payload, { headers });
 }
-export function listGallery() {
-  return api.get("/api/gallery/");
+export function listGallery(token, cursor) {
+  // one page of metadata: { items: [{ id, title, image_url, thumbnail_url, ... }], next_cursor }
+  const headers = token ? { Authorization: `Bearer ${token}` } : {};
+  const params = cursor ? { cursor } : {};
+  return api.get("/api/gallery/", { headers, params });
+}
+export async function fetchDiagramImage(imageUrl, token) {
+  // images are auth-protected, so fetch as a blob and hand back an object URL
+  const headers = token ? { Authorization: `Bearer ${token}` } : {};
+  const res = await api.get(imageUrl, { headers, responseType: "blob" });
+  return URL.createObjectURL(res.data);
 }
 export function getDiagram(id) {
   return api.get(`/api/gallery/${id}`);
@@ -28,10 +37,30 @@ export function deleteDiagram(id, token) {
   return api.delete(`/api/gallery/${id}`, { headers });
 }
 
-// AI cleanup (expects multipart/form-data)
+// Boards (server-side vector documents). Saves are deltas: only ops drawn since
+// the last save are sent, and the server appends them to the board's op log.
+export function saveBoardOps(boardId, ops, token) {
+  const headers = token ? { Authorization: `Bearer ${token}` } : {};
+  return api.post(`/api/boards/${boardId}/elements`, { ops }, { headers });
+}
+export function getBoardElements(boardId, token, { bbox, after } = {}) {
+  // { version, truncated, elements: [op + id/bbox, ...] }; bbox = [x0, y0, x1, y1] limits to a viewport.
+  // A page holds at most 5000 elements: while truncated, ask again with after = the last element's id
+  const headers = token ? { Authorization: `Bearer ${token}` } : {};
+  const params = {};
+  if (bbox) params.bbox = bbox.join(",");
+  if (after !== undefined) params.after = after;
+  return api.get(`/api/boards/${boardId}/elements`, { headers, params });
+}
+
+// AI cleanup (expects multipart/form-data with an "image" file); responds with
+// the cleaned image as binary, or 202 + { job_id } to poll via getAiJob
 export function aiCleanup(formData, token) {
   const headers = token ? { Authorization: `Bearer ${token}`, "Content-Type": "multipart/form-data" } : { "Content-Type": "multipart/form-data" };
-  return api.post("/api/ai/cleanup", formData, { headers });
+  return api.post("/api/ai/cleanup", formData, { headers, responseType: "blob" });
+}
+export function getAiJob(jobId) {
+  return api.get(`/api/ai/jobs/${jobId}`);
 }
 
 export default api;
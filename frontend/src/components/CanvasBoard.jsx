@@ -8,6 +8,11 @@
    - Save to gallery (calls /api/gallery, requires backend)
    - Download PNG (native)
    - Keyboard shortcuts (Ctrl+Z, Ctrl+Y)
+   - Live collaboration: committed strokes/shapes are sent as compact ops over
+     /ws/board/{room} (room from ?room=, default "default") and replayed from
+     the server op log on (re)connect
+   - Autosave (with ?board=<id> and a token): the board is restored from
+     /api/boards/{id}/elements and new ops are appended every few seconds
    - Toolbar event wiring via window CustomEvents:
        - "tool-change" { tool }
        - "color-change" { color }
@@ -18,6 +23,21 @@
 */
 
 import React, { useRef, useEffect, useState } from "react";
+import { getBoardElements, saveBoardOps } from "../api";
+
+const AUTOSAVE_MS = 3000;
+// How long an out-of-order op waits for the missing seqs before we resync from the server
+const GAP_TIMEOUT_MS = 1000;
+
+/* websocket URL for a board room (same origin unless VITE_BACKEND_URL is set) */
+function boardSocketUrl(room, since = 0, epoch = null) {
+  const base = import.meta.env.VITE_BACKEND_URL || window.location.origin;
+  const url = new URL(`/ws/board/${encodeURIComponent(room)}`, base);
+  url.protocol = url.protocol === "https:" ? "wss:" : "ws:";
+  url.searchParams.set("since", String(since));
+  if (epoch) url.searchParams.set("epoch", epoch);
+  return url.toString();
+}
 
 /* small helper to download without extra deps */
 function downloadDataUrl(dataUrl, filename = "whiteboard.png") {
@@ -29,7 +49,7 @@ function downloadDataUrl(dataUrl, filename = "whiteboard.png") {
   a.remove();
 }
 
-export default function CanvasBoard() {
+export default function CanvasBoard({ token }) {
   const containerRef = useRef(null);
   const mainRef = useRef(null);     // main canvas (committed drawing)
   const overlayRef = useRef(null);  // overlay canvas (preview)
@@ -46,6 +66,16 @@ export default function CanvasBoard() {
   const redoRef = useRef([]);
   const MAX_HISTORY = 60;
 
+  // realtime sync state
+  const socketRef = useRef(null);
+  const clientIdRef = useRef(null);
+  const lastSeqRef = useRef(0);
+  const epochRef = useRef(null);        // id of the room log lastSeqRef refers to
+  const strokePointsRef = useRef([]);   // flat [x0, y0, x1, y1, ...] of the stroke in progress
+  const pendingOpsRef = useRef([]);     // local ops not yet autosaved
+  const restoreBoardRef = useRef(null); // redraws the saved board (?board=), while autosave is active
+  const boardId = new URLSearchParams(window.location.search).get("board");
+
   // gallery (client-side cache)
   const [gallery, setGallery] = useState([]);
 
@@ -242,6 +272,7 @@ export default function CanvasBoard() {
 
     if (tool === "pen" || tool === "eraser") {
       pushHistory();
+      strokePointsRef.current = [pos.x, pos.y];
       ctx.beginPath();
       ctx.moveTo(pos.x, pos.y);
       ctx.strokeStyle = tool === "eraser" ? "#ffffff" : color;
@@ -259,6 +290,7 @@ export default function CanvasBoard() {
     const pos = clientToCanvas(clientX, clientY);
 
     if (tool === "pen" || tool === "eraser") {
+      strokePointsRef.current.push(pos.x, pos.y);
       ctx.lineTo(pos.x, pos.y);
       ctx.stroke();
     } else {
@@ -307,6 +339,14 @@ export default function CanvasBoard() {
       ctx.closePath();
       ctx.globalCompositeOperation = "source-over";
       pushHistory();
+      sendOp({
+        kind: "stroke",
+        tool,
+        color,
+        width: tool === "eraser" ? 20 : 2,
+        points: strokePointsRef.current,
+      });
+      strokePointsRef.current = [];
     } else {
       // commit preview to main canvas
       const sx = startPos.x;
@@ -337,8 +377,12 @@ export default function CanvasBoard() {
           ctx.fillStyle = color;
           ctx.font = "18px Arial";
           ctx.fillText(txt, dx, dy);
+          sendOp({ kind: "shape", tool, color, width: 2, points: [dx, dy], text: txt });
         }
       }
+      if (tool !== "text") {
+        sendOp({ kind: "shape", tool, color, width: 2, points: [sx, sy, dx, dy] });
+      }
       overlayCtx.clearRect(0, 0, overlayRef.current.width, overlayRef.current.height);
     }
 
@@ -364,6 +408,58 @@ export default function CanvasBoard() {
     context.fill();
   };
 
+  // Replay a stroke/shape op received from the board socket
+  const drawOp = (op) => {
+    if (!ctx || !op) return;
+    const p = op.points || [];
+    ctx.save();
+    ctx.strokeStyle = op.color;
+    ctx.lineWidth = op.width;
+    if (op.kind === "stroke") {
+      if (p.length < 2) {
+        ctx.restore();
+        return;
+      }
+      ctx.globalCompositeOperation = op.tool === "eraser" ? "destination-out" : "source-over";
+      ctx.beginPath();
+      ctx.moveTo(p[0], p[1]);
+      for (let i = 2; i < p.length; i += 2) ctx.lineTo(p[i], p[i + 1]);
+      ctx.stroke();
+    } else if (op.kind === "shape") {
+      const [sx, sy, dx, dy] = p;
+      if (op.tool === "rect") {
+        ctx.strokeRect(sx, sy, dx - sx, dy - sy);
+      } else if (op.tool === "ellipse") {
+        ctx.beginPath();
+        ctx.ellipse((sx + dx) / 2, (sy + dy) / 2, Math.abs(dx - sx) / 2, Math.abs(dy - sy) / 2, 0, 0, Math.PI * 2);
+        ctx.stroke();
+      } else if (op.tool === "line") {
+        ctx.beginPath();
+        ctx.moveTo(sx, sy);
+        ctx.lineTo(dx, dy);
+        ctx.stroke();
+      } else if (op.tool === "arrow") {
+        drawArrow(ctx, { x: sx, y: sy }, { x: dx, y: dy }, op.color);
+      } else if (op.tool === "text" && op.text) {
+        ctx.fillStyle = op.color;
+        ctx.font = "18px Arial";
+        ctx.fillText(op.text, sx, sy);
+      }
+    } else if (op.kind === "clear") {
+      ctx.clearRect(0, 0, mainRef.current.width, mainRef.current.height);
+    }
+    ctx.restore();
+  };
+
+  // Send a committed op to the room (no-op while offline)
+  const sendOp = (op) => {
+    if (boardId) pendingOpsRef.current.push(op);
+    const ws = socketRef.current;
+    if (ws && ws.readyState === WebSocket.OPEN) {
+      ws.send(JSON.stringify({ type: "op", op }));
+    }
+  };
+
   // Save current canvas to gallery (calls backend)
   const saveToGallery = async () => {
     if (!mainRef.current) return;
@@ -376,7 +472,7 @@ export default function CanvasBoard() {
       await fetch("/api/gallery", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ title: `Sketch ${Date.now()}`, data_json: data }),
+        body: JSON.stringify({ title: `Sketch ${Date.now()}`, data }),
       });
     } catch (err) {
       console.error("Save failed", err);
@@ -414,26 +510,29 @@ export default function CanvasBoard() {
     downloadDataUrl(url, "whiteboard.png");
   };
 
-  // Simple AI clean stub (calls /api/ai/cleanup if exists)
+  // AI clean: upload the canvas as a PNG and draw back the binary result
   const aiClean = async () => {
     try {
-      const data = mainRef.current.toDataURL("image/png");
-      const res = await fetch("/api/ai/cleanup", {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ image: data }),
-      });
+      const blob = await new Promise((resolve) => mainRef.current.toBlob(resolve, "image/png"));
+      const form = new FormData();
+      form.append("image", blob, "board.png");
+      let res = await fetch("/api/ai/cleanup", { method: "POST", body: form });
+      // busy server: the job keeps running, poll until it is done
+      while (res.status === 202) {
+        const job = await res.json();
+        await new Promise((r) => setTimeout(r, 1000));
+        res = await fetch(`/api/ai/jobs/${job.job_id}/result`);
+      }
       if (res.ok) {
-        const json = await res.json();
-        if (json.cleaned_image) {
-          const img = new Image();
-          img.onload = () => {
-            ctx.clearRect(0, 0, mainRef.current.width, mainRef.current.height);
-            ctx.drawImage(img, 0, 0, mainRef.current.clientWidth, mainRef.current.clientHeight);
-            pushHistory();
-          };
-          img.src = json.cleaned_image;
-        }
+        const url = URL.createObjectURL(await res.blob());
+        const img = new Image();
+        img.onload = () => {
+          ctx.clearRect(0, 0, mainRef.current.width, mainRef.current.height);
+          ctx.drawImage(img, 0, 0, mainRef.current.clientWidth, mainRef.current.clientHeight);
+          URL.revokeObjectURL(url);
+          pushHistory();
+        };
+        img.src = url;
       } else {
         alert("AI clean failed");
       }
@@ -443,6 +542,129 @@ export default function CanvasBoard() {
     }
   };
 
+  // Board socket: replay the room log on connect, then apply remote ops as they arrive
+  useEffect(() => {
+    if (!ctx) return;
+    const room = new URLSearchParams(window.location.search).get("room") || "default";
+    let closed = false;
+    let retry = null;
+
+    const open = () => {
+      clientIdRef.current = null;
+      const ws = new WebSocket(boardSocketUrl(room, lastSeqRef.current, epochRef.current));
+      socketRef.current = ws;
+      const early = new Map();   // seq -> op message that arrived ahead of a gap
+      let gapTimer = null;
+      let resync = false;
+      const apply = (msg) => {
+        lastSeqRef.current = msg.seq;
+        // our own ops are already on the canvas
+        if (msg.client !== clientIdRef.current) drawOp(msg.op);
+      };
+      const handle = (msg) => {
+        if (msg.type === "batch") {
+          msg.messages.forEach(handle);
+        } else if (msg.type === "sync") {
+          clientIdRef.current = msg.client;
+          epochRef.current = msg.epoch;
+          if (msg.reset) {
+            // the room log restarted (e.g. server restart): our seqs are void, replay from scratch
+            lastSeqRef.current = 0;
+            ctx.clearRect(0, 0, mainRef.current.width, mainRef.current.height);
+            // the clear also wiped the saved board drawn on load; bring it back
+            if (restoreBoardRef.current) restoreBoardRef.current();
+          }
+          if (msg.truncated) console.warn("Board history is incomplete; older strokes were dropped");
+          msg.ops.forEach((entry) => {
+            if (entry.seq > lastSeqRef.current) drawOp(entry.op);
+          });
+          lastSeqRef.current = Math.max(lastSeqRef.current, msg.seq);
+        } else if (msg.type === "op") {
+          // ops queued before our sync are already part of it
+          if (!clientIdRef.current || msg.seq <= lastSeqRef.current) return;
+          if (msg.seq > lastSeqRef.current + 1) {
+            // hold it until the missing seqs arrive; if they don't, reconnect with ?since= to fetch them
+            early.set(msg.seq, msg);
+            if (!gapTimer) {
+              gapTimer = setTimeout(() => {
+                gapTimer = null;
+                if (early.size) {
+                  resync = true;
+                  ws.close();
+                }
+              }, GAP_TIMEOUT_MS);
+            }
+            return;
+          }
+          apply(msg);
+          while (early.has(lastSeqRef.current + 1)) {
+            const next = early.get(lastSeqRef.current + 1);
+            early.delete(next.seq);
+            apply(next);
+          }
+          if (!early.size && gapTimer) {
+            clearTimeout(gapTimer);
+            gapTimer = null;
+          }
+        }
+      };
+      ws.onmessage = (e) => handle(JSON.parse(e.data));
+      ws.onclose = () => {
+        clearTimeout(gapTimer);
+        if (!closed) retry = setTimeout(open, resync ? 0 : 2000);
+      };
+    };
+
+    open();
+    return () => {
+      closed = true;
+      clearTimeout(retry);
+      socketRef.current && socketRef.current.close();
+    };
+  }, [ctx]);
+
+  // Autosave: restore the stored board once, then append only the ops drawn since the last save
+  useEffect(() => {
+    if (!ctx || !boardId || !token) return;
+    let saving = false;
+    let active = true;
+    const restore = async () => {
+      // page through the board in draw order; elements saved meanwhile get higher ids and show up later
+      let after;
+      for (;;) {
+        const { data } = await getBoardElements(boardId, token, { after });
+        if (!active) return;
+        data.elements.forEach(drawOp);
+        if (!data.truncated || data.elements.length === 0) return;
+        after = data.elements[data.elements.length - 1].id;
+      }
+    };
+    restoreBoardRef.current = () => restore().catch((err) => console.error("Board restore failed", err));
+    restoreBoardRef.current();
+
+    const flush = async () => {
+      if (saving || pendingOpsRef.current.length === 0) return;
+      saving = true;
+      const ops = pendingOpsRef.current.splice(0);
+      try {
+        await saveBoardOps(boardId, ops, token);
+      } catch (err) {
+        // keep them for the next round
+        pendingOpsRef.current.unshift(...ops);
+        console.error("Autosave failed", err);
+      } finally {
+        saving = false;
+      }
+    };
+    const timer = setInterval(flush, AUTOSAVE_MS);
+    return () => {
+      active = false;
+      restoreBoardRef.current = null;
+      clearInterval(timer);
+      flush();
+    };
+  }, [ctx, token]);
+
   // Initial load: get gallery
   useEffect(() => {
     loadGallery();
@@ -495,8 +717,8 @@ export default function CanvasBoard() {
         <div style={{ display: "flex", flexDirection: "column", gap: 10 }}>
           {gallery.length === 0 && <div className="small">No saved items</div>}
           {gallery.map((item, idx) => {
-            // backend might return items with id and data_json; be flexible
-            const src = item.data_json || item || "";
+            // backend items carry thumbnail/image URLs; freshly saved ones are data URLs
+            const src = item.thumbnail_url || item || "";
             const id = item.id || idx;
             return (
               <div key={id} style={{ borderRadius: 6, overflow: "hidden", border: "1px solid rgba(255,255,255,0.03)", padding: 6 }}>
@@ -510,7 +732,7 @@ export default function CanvasBoard() {
                       ctx.drawImage(img, 0, 0, mainRef.current.clientWidth, mainRef.current.clientHeight);
                       pushHistory();
                     };
-                    img.src = src;
+                    img.src = item.image_url || src;
                   }}>Open</button>
                   {item.id && <button onClick={() => deleteGalleryItem(item.id)}>Delete</button>}
                 </div>
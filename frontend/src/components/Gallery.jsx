@@ -1,24 +1,48 @@
 import React, { useEffect, useState } from "react";
-import { listGallery, deleteDiagram } from "../api";
+import { listGallery, deleteDiagram, fetchDiagramImage } from "../api";
 
-export default function Gallery({ onLoad }) {
+export default function Gallery({ onLoad, token }) {
   const [items, setItems] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [thumbs, setThumbs] = useState({}); // id -> object URL of the thumbnail
 
-  const refresh = async () => {
+  const loadPage = async (cursor) => {
     try {
-      const res = await listGallery();
-      // assume res.data is array of { id, title, data_json }
-      setItems(res.data || []);
+      const res = await listGallery(token, cursor);
+      // res.data is { items: [{ id, title, image_url, thumbnail_url, ... }], next_cursor }
+      const page = res.data || {};
+      setItems((prev) => (cursor ? [...prev, ...(page.items || [])] : page.items || []));
+      setNextCursor(page.next_cursor || null);
     } catch (err) {
       console.error("Failed to load gallery", err);
-      setItems([]);
+      if (!cursor) setItems([]);
     }
   };
 
-  useEffect(() => { refresh(); }, []);
+  const refresh = () => loadPage(null);
+
+  useEffect(() => { refresh(); }, [token]);
+
+  // fetch each thumbnail once; the browser cache revalidates by ETag
+  useEffect(() => {
+    items.forEach((it) => {
+      if (thumbs[it.id]) return;
+      fetchDiagramImage(it.thumbnail_url, token)
+        .then((url) => setThumbs((m) => ({ ...m, [it.id]: url })))
+        .catch((err) => console.warn("Failed to load thumbnail", it.id, err));
+    });
+  }, [items]);
+
+  const open = async (it) => {
+    try {
+      onLoad(await fetchDiagramImage(it.image_url, token));
+    } catch (err) {
+      console.error("Failed to load image", err);
+    }
+  };
 
   const remove = async (id) => {
-    await deleteDiagram(id);
+    await deleteDiagram(id, token);
     refresh();
   };
 
@@ -30,17 +54,20 @@ export default function Gallery({ onLoad }) {
         {items.map((it) => (
           <div key={it.id} style={{ background: "#0b1220", padding: 6, borderRadius: 6 }}>
             <div style={{ display: "flex", gap: 6 }}>
-              <img src={typeof it.data_json === "string" ? (JSON.parse(it.data_json).png || it.data_json) : it.data_json} alt={it.title} style={{ width: 80, height: 60, objectFit: "cover", borderRadius: 4 }} />
+              <img src={thumbs[it.id] || ""} alt={it.title} style={{ width: 80, height: 60, objectFit: "cover", borderRadius: 4 }} />
               <div style={{ flex: 1 }}>
                 <div style={{ fontSize: 13 }}>{it.title}</div>
                 <div style={{ display: "flex", gap: 6, marginTop: 8 }}>
-                  <button className="tool-btn" onClick={() => onLoad(typeof it.data_json === "string" ? (JSON.parse(it.data_json).png || it.data_json) : it.data_json)}>Open</button>
+                  <button className="tool-btn" onClick={() => open(it)}>Open</button>
                   <button className="tool-btn" onClick={() => remove(it.id)}>Delete</button>
                 </div>
               </div>
             </div>
           </div>
         ))}
+        {nextCursor && (
+          <button className="tool-btn" onClick={() => loadPage(nextCursor)}>Load more</button>
+        )}
       </div>
     </div>
   );